@@ -0,0 +1,223 @@
+import asyncio
+import math
+import time
+
+from collections import OrderedDict, deque
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionTicket:
+    __slots__ = ("user_id", "tokens", "slots", "tokens_used", "future", "enqueued_at", "granted_at")
+
+    def __init__(self, user_id, tokens, slots=1):
+        self.user_id = user_id
+        self.tokens = tokens
+        self.slots = slots
+        self.tokens_used = None
+        self.future = None
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+
+
+class GeminiAdmission:
+    def __init__(self, max_concurrency, tokens_per_minute, per_user_limit, max_wait, max_queue,
+                 initial_call_seconds=20.0):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.per_user_limit = per_user_limit
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.user_in_flight = {}
+        self.waiting = OrderedDict()
+        self.queued = 0
+        self.tokens = float(tokens_per_minute)
+        self.refilled_at = time.monotonic()
+        self.refill_timer = None
+        self.avg_call_seconds = initial_call_seconds
+        self.stats = {
+            "admitted": 0,
+            "queued_total": 0,
+            "rejected_queue_full": 0,
+            "rejected_wait": 0,
+            "timed_out": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "tokens_estimated": 0,
+            "tokens_used": 0,
+        }
+
+    def _refill(self):
+        if self.tokens_per_minute <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(
+            float(self.tokens_per_minute),
+            self.tokens + (now - self.refilled_at) * self.tokens_per_minute / 60,
+        )
+        self.refilled_at = now
+
+    def _token_cost(self, tokens):
+        if self.tokens_per_minute <= 0:
+            return 0
+        return min(tokens, self.tokens_per_minute)
+
+    def _user_has_room(self, user_id):
+        return self.user_in_flight.get(user_id, 0) < self.per_user_limit
+
+    def _global_has_room(self, tokens, slots=1):
+        return self.in_flight + slots <= self.max_concurrency and self.tokens >= self._token_cost(tokens)
+
+    def _grant(self, ticket):
+        self.in_flight += ticket.slots
+        self.user_in_flight[ticket.user_id] = self.user_in_flight.get(ticket.user_id, 0) + 1
+        self.tokens -= self._token_cost(ticket.tokens)
+        ticket.granted_at = time.monotonic()
+
+        waited = ticket.granted_at - ticket.enqueued_at
+        self.stats["admitted"] += 1
+        self.stats["tokens_estimated"] += ticket.tokens
+        self.stats["wait_seconds_total"] += waited
+        self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+
+    def _dispatch(self):
+        self.refill_timer = None
+        self._refill()
+        progressed = True
+        while progressed and self.waiting:
+            progressed = False
+            for user_id in list(self.waiting):
+                if not self._user_has_room(user_id):
+                    continue
+                queue = self.waiting[user_id]
+                ticket = queue[0]
+                if not self._global_has_room(ticket.tokens, ticket.slots):
+                    self._schedule_refill(ticket.tokens)
+                    return
+
+                queue.popleft()
+                self.queued -= 1
+                if queue:
+                    self.waiting.move_to_end(user_id)
+                else:
+                    del self.waiting[user_id]
+                self._grant(ticket)
+                ticket.future.set_result(True)
+                progressed = True
+
+    def _schedule_refill(self, tokens):
+        if self.refill_timer is not None or self.in_flight >= self.max_concurrency:
+            return
+        deficit = self._token_cost(tokens) - self.tokens
+        if deficit <= 0:
+            return
+        delay = deficit * 60 / self.tokens_per_minute
+        self.refill_timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _estimate_wait(self, tokens):
+        self._refill()
+        slots_wait = 0.0
+        if self.in_flight >= self.max_concurrency or self.queued:
+            slots_wait = (self.queued + 1) / self.max_concurrency * self.avg_call_seconds
+
+        tokens_wait = 0.0
+        if self.tokens_per_minute > 0:
+            tokens_ahead = sum(self._token_cost(t.tokens) for queue in self.waiting.values() for t in queue)
+            deficit = tokens_ahead + self._token_cost(tokens) - self.tokens
+            if deficit > 0:
+                tokens_wait = deficit * 60 / self.tokens_per_minute
+
+        return max(slots_wait, tokens_wait)
+
+    def _remove(self, ticket):
+        queue = self.waiting.get(ticket.user_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        self.queued -= 1
+        if not queue:
+            del self.waiting[ticket.user_id]
+
+    async def acquire(self, user_id, tokens, slots=1):
+        ticket = AdmissionTicket(user_id, tokens, max(1, min(slots, self.max_concurrency)))
+        self._refill()
+
+        if not self.waiting and self._user_has_room(user_id) and self._global_has_room(tokens, ticket.slots):
+            self._grant(ticket)
+            return ticket
+
+        if self.queued >= self.max_queue:
+            self.stats["rejected_queue_full"] += 1
+            raise AdmissionRejected("Lesson generation queue is full", self._estimate_wait(tokens))
+
+        estimated_wait = self._estimate_wait(tokens)
+        if self._user_has_room(user_id) and estimated_wait > self.max_wait:
+            self.stats["rejected_wait"] += 1
+            raise AdmissionRejected("Lesson generation is over capacity", estimated_wait)
+
+        ticket.future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(user_id, deque()).append(ticket)
+        self.queued += 1
+        self.stats["queued_total"] += 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if ticket.granted_at is not None:
+                return ticket
+            self._remove(ticket)
+            self.stats["timed_out"] += 1
+            raise AdmissionRejected("Timed out waiting for lesson generation capacity", self._estimate_wait(tokens))
+        except asyncio.CancelledError:
+            if ticket.granted_at is not None:
+                self.release(ticket)
+            else:
+                self._remove(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket):
+        self.in_flight -= ticket.slots
+        remaining = self.user_in_flight.get(ticket.user_id, 1) - 1
+        if remaining > 0:
+            self.user_in_flight[ticket.user_id] = remaining
+        else:
+            self.user_in_flight.pop(ticket.user_id, None)
+
+        elapsed = time.monotonic() - ticket.granted_at
+        self.avg_call_seconds = 0.8 * self.avg_call_seconds + 0.2 * elapsed
+
+        if ticket.tokens_used is not None:
+            self.stats["tokens_used"] += ticket.tokens_used
+            if self.tokens_per_minute > 0:
+                self._refill()
+                overestimate = self._token_cost(ticket.tokens) - ticket.tokens_used
+                self.tokens = min(float(self.tokens_per_minute), self.tokens + overestimate)
+
+        self._dispatch()
+
+    def has_capacity(self):
+        return not self.waiting and self.in_flight < self.max_concurrency
+
+    def snapshot(self):
+        self._refill()
+        admitted = self.stats["admitted"]
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "queued_users": len(self.waiting),
+            "max_queue": self.max_queue,
+            "tokens_available": int(self.tokens) if self.tokens_per_minute > 0 else None,
+            "tokens_per_minute": self.tokens_per_minute,
+            "avg_wait_seconds": self.stats["wait_seconds_total"] / admitted if admitted else 0.0,
+            "avg_call_seconds": self.avg_call_seconds,
+        }
@@ -0,0 +1,36 @@
+import asyncio
+import httpx
+
+
+class BotNotifier:
+    def __init__(self, base_url, secret=None):
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.headers = {"X-Studiora-Secret": secret} if secret else {}
+        self.client = None
+        self.tasks = set()
+
+    async def start(self):
+        if self.base_url:
+            self.client = httpx.AsyncClient(timeout=5.0)
+
+    async def close(self):
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def profile_changed(self, telegram_id, request_id=None):
+        if self.client is None:
+            return
+        task = asyncio.create_task(self._post(f"/internal/profiles/{telegram_id}/invalidate", request_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _post(self, path, request_id=None):
+        headers = {**self.headers, "X-Request-ID": request_id} if request_id else self.headers
+        try:
+            response = await self.client.post(f"{self.base_url}{path}", headers=headers)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Bot notification error: {e}")
@@ -0,0 +1,38 @@
+import asyncio
+
+from resilience import CircuitOpen, DeadlineExceeded
+
+
+async def run_sections(sections, write, max_concurrency, attempts, stats, on_done=None):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results = {}
+
+    async def run(section):
+        for attempt in range(attempts):
+            try:
+                async with semaphore:
+                    result = await write(section)
+            except (CircuitOpen, DeadlineExceeded):
+                raise
+            except Exception as e:
+                if attempt + 1 >= attempts:
+                    stats["section_failures"] += 1
+                    raise
+                stats["section_retries"] += 1
+                print(f"Retrying lesson section {section}: {e}")
+                continue
+            results[section] = result
+            stats["sections"] += 1
+            if on_done is not None:
+                await on_done(section, len(results))
+            return
+
+    tasks = [asyncio.create_task(run(section)) for section in sections]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return results
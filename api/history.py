@@ -0,0 +1,178 @@
+import base64
+import os
+import re
+import sys
+import asyncio
+
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+
+LESSONS_COLLECTION = "lessons"
+LESSON_FILENAME_RE = re.compile(r"^(?P<topic>.*)_(?P<lesson_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\.pdf$")
+
+
+def topic_key(topic):
+    return " ".join(str(topic).split()).casefold()
+
+
+def encode_cursor(lesson):
+    created_ms = int(lesson["created_at"].replace(tzinfo=timezone.utc).timestamp() * 1000)
+    raw = f"{created_ms}:{lesson['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_ms, lesson_id = base64.urlsafe_b64decode(padded.encode()).decode().split(":", 1)
+    return datetime.fromtimestamp(int(created_ms) / 1000, tz=timezone.utc), lesson_id
+
+
+def public_lesson(lesson):
+    return {
+        "lesson_id": lesson["_id"],
+        "filename": lesson["filename"],
+        "topic": lesson.get("topic"),
+        "current_level": lesson.get("current_level"),
+        "target_level": lesson.get("target_level"),
+        "language_code": lesson.get("language_code"),
+        "size": lesson.get("size"),
+        "created_at": lesson["created_at"],
+    }
+
+
+class LessonHistory:
+    def __init__(self, db):
+        self.lessons = db[LESSONS_COLLECTION]
+
+    async def ensure_indexes(self):
+        await self.lessons.create_index(
+            [("telegram_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_created_at",
+        )
+        await self.lessons.create_index(
+            [("telegram_id", ASCENDING), ("topic_key", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_topic_created_at",
+        )
+        await self.lessons.create_index(
+            [("telegram_id", ASCENDING), ("language_code", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_language_created_at",
+        )
+        await self.lessons.create_index(
+            [("telegram_id", ASCENDING), ("filename", ASCENDING)],
+            name="user_filename",
+            unique=True,
+        )
+
+    async def record(self, lesson_id, telegram_id, filename, lesson_request, size, storage_key, content_hash=None, created_at=None):
+        lesson = {
+            "_id": lesson_id,
+            "telegram_id": telegram_id,
+            "filename": filename,
+            "topic": lesson_request.get("topic"),
+            "topic_key": topic_key(lesson_request.get("topic", "")),
+            "current_level": lesson_request.get("current_level"),
+            "target_level": lesson_request.get("target_level"),
+            "language_code": lesson_request.get("language_code"),
+            "size": size,
+            "storage_key": storage_key,
+            "content_hash": content_hash,
+            "created_at": created_at or datetime.now(timezone.utc),
+        }
+        await self.lessons.insert_one(lesson)
+        return lesson
+
+    async def get(self, telegram_id, lesson_id):
+        return await self.lessons.find_one({"_id": lesson_id, "telegram_id": telegram_id})
+
+    async def page(self, telegram_id, limit, skip=0, cursor=None, topic=None, language_code=None, known_total=None):
+        query = {"telegram_id": telegram_id}
+        if topic:
+            query["topic_key"] = topic_key(topic)
+        if language_code:
+            query["language_code"] = language_code
+
+        page_query = dict(query)
+        if cursor:
+            created_at, lesson_id = decode_cursor(cursor)
+            page_query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": lesson_id}},
+            ]
+
+        find = self.lessons.find(page_query).sort([("created_at", DESCENDING), ("_id", DESCENDING)])
+        if skip and not cursor:
+            find = find.skip(skip)
+        lessons = await find.limit(limit + 1).to_list(length=limit + 1)
+
+        has_more = len(lessons) > limit
+        lessons = lessons[:limit]
+
+        if known_total is not None and not topic and not language_code:
+            total_count = known_total
+        else:
+            total_count = await self.lessons.count_documents(query)
+
+        return {
+            "lessons": lessons,
+            "total_count": total_count,
+            "next_cursor": encode_cursor(lessons[-1]) if has_more and lessons else None,
+        }
+
+
+async def backfill(db, db_dir="db"):
+    lessons = db[LESSONS_COLLECTION]
+    users = db["users"]
+    await LessonHistory(db).ensure_indexes()
+
+    if not os.path.isdir(db_dir):
+        print(f"No lesson directory at {db_dir}")
+        return
+
+    for user_dir in sorted(os.listdir(db_dir)):
+        if not user_dir.isdigit():
+            continue
+        telegram_id = int(user_dir)
+        operations = []
+
+        for entry in os.scandir(os.path.join(db_dir, user_dir)):
+            match = LESSON_FILENAME_RE.match(entry.name)
+            if not entry.is_file() or not match:
+                continue
+            stat = entry.stat()
+            topic = match.group("topic").replace("_", " ")
+            operations.append(UpdateOne(
+                {"telegram_id": telegram_id, "filename": entry.name},
+                {"$setOnInsert": {
+                    "_id": match.group("lesson_id"),
+                    "topic": topic,
+                    "topic_key": topic_key(topic),
+                    "current_level": None,
+                    "target_level": None,
+                    "language_code": None,
+                    "size": stat.st_size,
+                    "storage_key": f"{user_dir}/{entry.name}",
+                    "created_at": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+                }},
+                upsert=True,
+            ))
+
+        if operations:
+            await lessons.bulk_write(operations, ordered=False)
+
+        lesson_count = await lessons.count_documents({"telegram_id": telegram_id})
+        await users.update_one({"_id": telegram_id}, {"$set": {"lesson_count": lesson_count}})
+        print(f"{telegram_id}: {len(operations)} files, {lesson_count} lessons indexed")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        print("Usage: python history.py backfill")
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv()
+    mongo_client = AsyncIOMotorClient(os.getenv("MONGO_DB"))
+    asyncio.run(backfill(mongo_client.get_database(os.getenv("MONGO_DB_NAME", "Studiora"))))
@@ -0,0 +1,259 @@
+import asyncio
+import os
+import socket
+import uuid
+import httpx
+
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+
+LESSON_JOBS_COLLECTION = "lesson_jobs"
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class JobDeferred(Exception):
+    def __init__(self, reason, delay):
+        super().__init__(reason)
+        self.delay = delay
+
+
+def public_job(job):
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "telegram_id": job["telegram_id"],
+        "params": job.get("params"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "attempts": job.get("attempts", 0),
+        "progress": job.get("progress"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+    }
+
+
+class LessonJobQueue:
+    def __init__(self, db, handler, concurrency, lease_seconds=300, max_attempts=3,
+                 poll_interval=2.0, callback_url=None, callback_secret=None):
+        self.collection = db[LESSON_JOBS_COLLECTION]
+        self.handler = handler
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.callback_url = callback_url
+        self.callback_secret = callback_secret
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.wakeup = asyncio.Event()
+        self.workers = []
+        self.http = None
+
+    async def ensure_indexes(self):
+        await self.collection.create_index(
+            [("idempotency_key", ASCENDING)],
+            name="active_idempotency_key",
+            unique=True,
+            partialFilterExpression={"active": True},
+        )
+        await self.collection.create_index(
+            [("status", ASCENDING), ("available_at", ASCENDING)],
+            name="status_available_at",
+        )
+        await self.collection.create_index([("lease_until", ASCENDING)], name="lease_until", sparse=True)
+
+    async def submit(self, telegram_id, params, idempotency_key, request_id=None):
+        existing = await self.collection.find_one({"idempotency_key": idempotency_key, "active": True})
+        if existing is not None:
+            return existing, False
+
+        now = datetime.now(timezone.utc)
+        job = {
+            "_id": uuid.uuid4().hex,
+            "idempotency_key": idempotency_key,
+            "active": True,
+            "telegram_id": telegram_id,
+            "params": params,
+            "request_id": request_id,
+            "status": JOB_QUEUED,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+            "available_at": now,
+        }
+        try:
+            await self.collection.insert_one(job)
+        except DuplicateKeyError:
+            existing = await self.collection.find_one({"idempotency_key": idempotency_key, "active": True})
+            if existing is not None:
+                return existing, False
+            raise
+
+        self.wakeup.set()
+        return job, True
+
+    async def get(self, job_id):
+        return await self.collection.find_one({"_id": job_id})
+
+    async def claim_delivery(self, job_id):
+        return await self.collection.find_one_and_update(
+            {"_id": job_id, "status": {"$in": [JOB_DONE, JOB_FAILED]}, "delivered_at": {"$exists": False}},
+            {"$set": {"delivered_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def start(self):
+        self.http = httpx.AsyncClient(timeout=10.0)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+    async def _claim(self):
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": JOB_QUEUED, "available_at": {"$lte": now}},
+                {"status": JOB_RUNNING, "lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": JOB_RUNNING,
+                    "worker_id": self.worker_id,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except PyMongoError as e:
+                print(f"Job queue error: {e}")
+                job = None
+
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def report_progress(self, job, progress):
+        await self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"progress": progress, "updated_at": datetime.now(timezone.utc)}},
+        )
+        await self._notify({**job, "progress": progress}, event="progress")
+
+    async def _renew_lease(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await self.collection.update_one(
+                {"_id": job_id, "worker_id": self.worker_id},
+                {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}},
+            )
+
+    async def _run(self, job):
+        heartbeat = asyncio.create_task(self._renew_lease(job["_id"]))
+        try:
+            result = await self.handler(job)
+        except JobDeferred as e:
+            await self._defer(job, str(e), e.delay)
+            return
+        except Exception as e:
+            print(f"Lesson job {job['_id']} failed: {e}")
+            await self._fail(job, str(e))
+            return
+        finally:
+            heartbeat.cancel()
+
+        now = datetime.now(timezone.utc)
+        job = await self.collection.find_one_and_update(
+            {"_id": job["_id"]},
+            {
+                "$set": {"status": JOB_DONE, "active": False, "result": result, "updated_at": now},
+                "$unset": {"lease_until": "", "error": ""},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        await self._notify(job)
+
+    async def _defer(self, job, reason, delay):
+        now = datetime.now(timezone.utc)
+        await self.collection.update_one(
+            {"_id": job["_id"]},
+            {
+                "$set": {
+                    "status": JOB_QUEUED,
+                    "progress": {"stage": "queued", "reason": reason},
+                    "available_at": now + timedelta(seconds=delay),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": -1},
+                "$unset": {"lease_until": ""},
+            },
+        )
+
+    async def _fail(self, job, error):
+        now = datetime.now(timezone.utc)
+        if job["attempts"] < self.max_attempts:
+            await self.collection.update_one(
+                {"_id": job["_id"]},
+                {
+                    "$set": {
+                        "status": JOB_QUEUED,
+                        "error": error,
+                        "available_at": now + timedelta(seconds=10 * job["attempts"]),
+                        "updated_at": now,
+                    },
+                    "$unset": {"lease_until": ""},
+                },
+            )
+            return
+
+        job = await self.collection.find_one_and_update(
+            {"_id": job["_id"]},
+            {
+                "$set": {"status": JOB_FAILED, "active": False, "error": error, "updated_at": now},
+                "$unset": {"lease_until": ""},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        await self._notify(job)
+
+    async def _notify(self, job, event="finished"):
+        if not self.callback_url:
+            return
+
+        headers = {"X-Studiora-Secret": self.callback_secret} if self.callback_secret else {}
+        if job.get("request_id"):
+            headers["X-Request-ID"] = job["request_id"]
+        payload = public_job(job)
+        payload["event"] = event
+        payload["created_at"] = payload["created_at"].isoformat() if payload["created_at"] else None
+        payload["updated_at"] = payload["updated_at"].isoformat() if payload["updated_at"] else None
+        try:
+            response = await self.http.post(self.callback_url, json=payload, headers=headers)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Job callback error: {e}")
@@ -0,0 +1,266 @@
+import time
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from bson import Binary
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+
+from lessons import LESSON_FAMILY_FIELDS, same_lesson_family
+
+
+LESSON_CACHE_COLLECTION = "lesson_cache"
+LESSON_CACHE_STATS_COLLECTION = "lesson_cache_stats"
+LESSON_CACHE_SIZE_ID = "size"
+LESSON_CACHE_RESYNC_INTERVAL = 300
+MAX_SHARED_ENTRY_BYTES = 15 * 1024 * 1024
+
+
+class CachedLesson:
+    __slots__ = ("html", "pdf", "params")
+
+    def __init__(self, html, pdf, params=None):
+        self.html = html
+        self.pdf = pdf
+        self.params = params
+
+    @property
+    def size(self):
+        return len(self.html.encode("utf-8")) + len(self.pdf)
+
+
+class MemoryLessonCache:
+    def __init__(self, ttl_seconds, max_entries, max_bytes):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def get(self, key):
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        expires_at, lesson = item
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return lesson
+
+    def put(self, key, lesson):
+        size = lesson.size
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, lesson)
+        self.total_bytes += size
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, lesson = self.entries.pop(key)
+        self.total_bytes -= lesson.size
+
+    def find_source(self, params):
+        now = time.monotonic()
+        for key, (expires_at, lesson) in reversed(self.entries.items()):
+            source = lesson.params
+            if (
+                expires_at >= now
+                and source is not None
+                and "translated_from" not in source
+                and source.get("language_code") != params.get("language_code")
+                and same_lesson_family(source, params)
+            ):
+                return key, lesson
+        return None
+
+
+class MongoLessonCache:
+    def __init__(self, db, ttl_seconds, max_bytes):
+        self.collection = db[LESSON_CACHE_COLLECTION]
+        self.counters = db[LESSON_CACHE_STATS_COLLECTION]
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.resynced_at = 0.0
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+        await self.collection.create_index([("last_access", DESCENDING)], name="last_access")
+        await self.collection.create_index(
+            [(f"params.{field}", ASCENDING) for field in LESSON_FAMILY_FIELDS],
+            name="lesson_family",
+        )
+
+    async def get(self, key):
+        now = datetime.now(timezone.utc)
+        doc = await self.collection.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"$set": {"last_access": now}},
+            projection={"html": 1, "pdf": 1, "params": 1},
+        )
+        if doc is None:
+            return None
+        return CachedLesson(doc["html"], bytes(doc["pdf"]), doc.get("params"))
+
+    async def find_source(self, params):
+        query = {f"params.{field}": params.get(field) for field in LESSON_FAMILY_FIELDS}
+        query.update({
+            "params.language_code": {"$ne": params.get("language_code")},
+            "params.translated_from": {"$exists": False},
+            "expires_at": {"$gt": datetime.now(timezone.utc)},
+        })
+        doc = await self.collection.find_one(
+            query,
+            projection={"html": 1, "pdf": 1, "params": 1},
+            sort=[("last_access", DESCENDING)],
+        )
+        if doc is None:
+            return None
+        return doc["_id"], CachedLesson(doc["html"], bytes(doc["pdf"]), doc.get("params"))
+
+    async def put(self, key, lesson, params):
+        size = lesson.size
+        if size > MAX_SHARED_ENTRY_BYTES:
+            return
+        now = datetime.now(timezone.utc)
+        previous = await self.collection.find_one_and_replace(
+            {"_id": key},
+            {
+                "params": params,
+                "html": lesson.html,
+                "pdf": Binary(lesson.pdf),
+                "size": size,
+                "created_at": now,
+                "last_access": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            },
+            projection={"size": 1},
+            upsert=True,
+        )
+        total = await self._add_size(size - (previous or {}).get("size", 0))
+        if total > self.max_bytes:
+            await self._evict(total)
+
+    async def _add_size(self, delta):
+        counter = await self.counters.find_one_and_update(
+            {"_id": LESSON_CACHE_SIZE_ID},
+            {"$inc": {"total": delta}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return counter["total"]
+
+    async def _resync_size(self):
+        totals = await self.collection.aggregate([
+            {"$group": {"_id": None, "total": {"$sum": "$size"}}}
+        ]).to_list(length=1)
+        total = totals[0]["total"] if totals else 0
+        await self.counters.update_one({"_id": LESSON_CACHE_SIZE_ID}, {"$set": {"total": total}}, upsert=True)
+        self.resynced_at = time.monotonic()
+        return total
+
+    async def _evict(self, total):
+        if time.monotonic() - self.resynced_at > LESSON_CACHE_RESYNC_INTERVAL:
+            total = await self._resync_size()
+            if total <= self.max_bytes:
+                return
+
+        victims = []
+        freed = 0
+        async for doc in self.collection.find({}, {"size": 1}).sort("last_access", ASCENDING):
+            victims.append(doc["_id"])
+            freed += doc.get("size", 0)
+            if total - freed <= self.max_bytes:
+                break
+        if not victims:
+            return
+
+        result = await self.collection.delete_many({"_id": {"$in": victims}})
+        self.evictions += result.deleted_count
+        await self._add_size(-freed)
+
+
+class LessonCache:
+    def __init__(self, memory, shared=None):
+        self.memory = memory
+        self.shared = shared
+        self.stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "errors": 0, "source_hits": 0, "source_misses": 0}
+
+    async def ensure_indexes(self):
+        if self.shared is not None:
+            await self.shared.ensure_indexes()
+
+    async def get(self, key):
+        lesson = self.memory.get(key)
+        if lesson is not None:
+            self.stats["memory_hits"] += 1
+            return lesson
+
+        if self.shared is not None:
+            try:
+                lesson = await self.shared.get(key)
+            except PyMongoError as e:
+                print(f"Lesson cache error: {e}")
+                self.stats["errors"] += 1
+                lesson = None
+            if lesson is not None:
+                self.stats["shared_hits"] += 1
+                self.memory.put(key, lesson)
+                return lesson
+
+        self.stats["misses"] += 1
+        return None
+
+    async def fetch_shared(self, key):
+        if self.shared is None:
+            return self.memory.get(key)
+        try:
+            lesson = await self.shared.get(key)
+        except PyMongoError as e:
+            print(f"Lesson cache error: {e}")
+            self.stats["errors"] += 1
+            return None
+        if lesson is not None:
+            self.memory.put(key, lesson)
+        return lesson
+
+    async def find_source(self, params):
+        found = self.memory.find_source(params)
+        if found is None and self.shared is not None:
+            try:
+                found = await self.shared.find_source(params)
+            except PyMongoError as e:
+                print(f"Lesson cache error: {e}")
+                self.stats["errors"] += 1
+        self.stats["source_hits" if found is not None else "source_misses"] += 1
+        return found
+
+    async def put(self, key, lesson, params):
+        self.stats["stores"] += 1
+        lesson.params = params
+        self.memory.put(key, lesson)
+        if self.shared is not None:
+            try:
+                await self.shared.put(key, lesson, params)
+            except PyMongoError as e:
+                print(f"Lesson cache error: {e}")
+                self.stats["errors"] += 1
+
+    def snapshot(self):
+        hits = self.stats["memory_hits"] + self.stats["shared_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self.memory.entries),
+            "memory_bytes": self.memory.total_bytes,
+            "memory_evictions": self.memory.evictions,
+            "shared_evictions": self.shared.evictions if self.shared is not None else 0,
+        }
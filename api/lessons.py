@@ -0,0 +1,243 @@
+import hashlib
+import html
+import json
+import re
+
+
+LESSON_PROMPT_VERSION = "v1"
+
+GENERATION_MONOLITHIC = "monolithic"
+GENERATION_PARALLEL = "parallel"
+GENERATION_MODES = (GENERATION_MONOLITHIC, GENERATION_PARALLEL)
+
+LESSON_SECTIONS = (
+    "introduction",
+    "key_concepts",
+    "examples",
+    "exercises",
+    "summary",
+    "self_check",
+)
+
+SECTION_DEFAULT_HEADINGS = {
+    "introduction": "Introduction",
+    "key_concepts": "Key concepts and theory",
+    "examples": "Examples",
+    "exercises": "Practice exercises",
+    "summary": "Summary and study tips",
+    "self_check": "Self-check questions",
+}
+
+SECTION_INSTRUCTIONS = {
+    "introduction": "Introduce the topic, explain why it matters and what the student will be able to do after the lesson.",
+    "key_concepts": "Explain the key concepts and theory step by step, with definitions and short clarifications.",
+    "examples": "Give worked examples with explanations that apply the key concepts.",
+    "exercises": "Write at least 3 practice exercises of increasing difficulty. Do not give the answers here.",
+    "summary": "Summarize the lesson and give practical study tips for reaching the target level.",
+    "self_check": "Write 5 self-check questions, each followed by its answer.",
+}
+
+SECTION_HEADING_RE = re.compile(r"<h2[\s>]", re.IGNORECASE)
+CODE_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+DOCUMENT_TAG_RE = re.compile(r"</?(?:html|head|body)[^>]*>", re.IGNORECASE)
+H1_RE = re.compile(r"<h1[^>]*>.*?</h1>", re.IGNORECASE | re.DOTALL)
+H2_TAG_RE = re.compile(r"<(/?)h2\b", re.IGNORECASE)
+MARKUP_TAG_RE = re.compile(r"</?([a-zA-Z][a-zA-Z0-9]*)")
+
+LESSON_FAMILY_FIELDS = ("topic", "current_level", "target_level", "prompt_version", "generation_mode")
+
+
+def normalize_lesson_params(topic, current_level, target_level, language_code, generation_mode=GENERATION_MONOLITHIC):
+    params = {
+        "topic": " ".join(str(topic).split()).casefold(),
+        "current_level": " ".join(str(current_level).split()).upper(),
+        "target_level": " ".join(str(target_level).split()).upper(),
+        "language_code": str(language_code or "en").strip().lower(),
+        "prompt_version": LESSON_PROMPT_VERSION,
+    }
+    if generation_mode and generation_mode != GENERATION_MONOLITHIC:
+        params["generation_mode"] = generation_mode
+    return params
+
+
+def lesson_key(topic, current_level, target_level, language_code, generation_mode=GENERATION_MONOLITHIC):
+    params = normalize_lesson_params(topic, current_level, target_level, language_code, generation_mode)
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def same_lesson_family(params, other):
+    return all(params.get(field) == other.get(field) for field in LESSON_FAMILY_FIELDS)
+
+
+def build_lesson_prompt(topic, current_level, target_level, lesson_language):
+    return f"""
+        Create a detailed educational lesson as an HTML document.
+
+        Topic: "{topic}"  
+        Current level: {current_level}  
+        Target level: {target_level}
+        Lesson Language: {lesson_language}
+
+        The lesson must include:
+        1. Introduction
+        2. Key concepts and theory
+        3. Examples with explanations
+        4. Practice exercises (at least 3)
+        5. Summary and study tips
+        6. Self-check questions (5 questions with answers)
+
+        Requirements:
+        - Use **HTML5** only.
+        - Use tags like <h1>, <h2>, <p>, <ul>, <ol>, <li>, <strong>, <em>, <code>, <hr>.
+        - Do not include CSS or JavaScript — pure HTML only.
+        - Do not include <html>, <head>, or <body> tags — only the content inside.
+        - Make sure formatting is clean and suitable for PDF conversion.
+
+        Content must be understandable for a student at {current_level} and help reach {target_level}.
+    """
+
+
+def build_outline_prompt(topic, current_level, target_level, lesson_language):
+    sections = "\n".join(f"        - {section}: {SECTION_INSTRUCTIONS[section]}" for section in LESSON_SECTIONS)
+    return f"""
+        Plan a detailed educational lesson. Do not write the lesson itself yet.
+
+        Topic: "{topic}"
+        Current level: {current_level}
+        Target level: {target_level}
+        Lesson Language: {lesson_language}
+
+        The lesson has these sections, in this order:
+{sections}
+
+        Reply with JSON only, in this shape:
+        {{"title": "<lesson title>", "sections": [{{"id": "<section id from the list>", "heading": "<section heading>", "points": ["<what this section covers>", ...]}}]}}
+
+        Write the title, headings and points in the lesson language. Give 3 to 6 points per section
+        and make sure the sections build on each other without repeating content.
+    """
+
+
+def parse_outline(text, topic):
+    text = CODE_FENCE_RE.sub("", text or "")
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+
+    planned = {}
+    for item in data.get("sections") or []:
+        if isinstance(item, dict) and item.get("id") in SECTION_DEFAULT_HEADINGS:
+            planned[item["id"]] = item
+
+    sections = []
+    for section in LESSON_SECTIONS:
+        item = planned.get(section, {})
+        points = item.get("points") if isinstance(item.get("points"), list) else []
+        sections.append({
+            "id": section,
+            "heading": str(item.get("heading") or SECTION_DEFAULT_HEADINGS[section]).strip(),
+            "points": [str(point) for point in points],
+        })
+    return {"title": str(data.get("title") or topic).strip(), "sections": sections}
+
+
+def build_section_prompt(section, outline, topic, current_level, target_level, lesson_language):
+    plan = "\n".join(
+        f"        {'>' if item['id'] == section else '-'} {item['heading']}: " + "; ".join(item["points"])
+        for item in outline["sections"]
+    )
+    current = next(item for item in outline["sections"] if item["id"] == section)
+    return f"""
+        You are writing one section of the lesson "{outline['title']}".
+
+        Topic: "{topic}"
+        Current level: {current_level}
+        Target level: {target_level}
+        Lesson Language: {lesson_language}
+
+        Lesson plan (the section you write is marked with >):
+{plan}
+
+        Write only the section "{current['heading']}". {SECTION_INSTRUCTIONS[section]}
+        Cover the planned points and do not repeat what other sections cover.
+
+        Requirements:
+        - Use **HTML5** only.
+        - Use tags like <h3>, <p>, <ul>, <ol>, <li>, <strong>, <em>, <code>, <hr>.
+        - Do not write the section heading and do not use <h1> or <h2>.
+        - Do not include CSS or JavaScript — pure HTML only.
+        - Do not include <html>, <head>, or <body> tags — only the content inside.
+
+        Content must be understandable for a student at {current_level} and help reach {target_level}.
+    """
+
+
+def clean_section_html(text):
+    text = CODE_FENCE_RE.sub("", text or "")
+    text = DOCUMENT_TAG_RE.sub("", text)
+    text = H1_RE.sub("", text)
+    return H2_TAG_RE.sub(r"<\1h3", text).strip()
+
+
+def assemble_lesson(outline, bodies):
+    parts = [f"<h1>{html.escape(outline['title'])}</h1>"]
+    for item in outline["sections"]:
+        parts.append(f"<h2>{html.escape(item['heading'])}</h2>\n{bodies[item['id']]}")
+    return "\n".join(parts) + "\n"
+
+
+def split_lesson_html(lesson_html):
+    starts = [match.start() for match in SECTION_HEADING_RE.finditer(lesson_html)]
+    bounds = [0] + [start for start in starts if start > 0] + [len(lesson_html)]
+    return [lesson_html[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def markup_signature(fragment):
+    return [match.group(0).lower() for match in MARKUP_TAG_RE.finditer(fragment)]
+
+
+def build_translation_prompt(fragment, source_language, lesson_language):
+    return f"""
+        Translate this part of an HTML lesson from language "{source_language}" to language "{lesson_language}".
+        Keep every HTML tag exactly as it is and in the same order; translate only the text between tags.
+        Do not translate code inside <code> tags. Reply with the translated HTML only.
+
+{fragment}
+    """
+
+
+def clean_translation_html(text):
+    return CODE_FENCE_RE.sub("", text or "").strip()
+
+
+class LessonSectionTracker:
+    def __init__(self, sections=LESSON_SECTIONS):
+        self.sections = sections
+        self.buffer = ""
+        self.scan_from = 0
+        self.headings_seen = 0
+        self.completed = 0
+
+    def feed(self, text):
+        self.buffer += text
+        for match in SECTION_HEADING_RE.finditer(self.buffer, self.scan_from):
+            self.headings_seen += 1
+            self.scan_from = match.end()
+        self.scan_from = max(self.scan_from, len(self.buffer) - 3)
+        return self._advance(min(self.headings_seen - 1, len(self.sections)))
+
+    def finish(self):
+        return self._advance(len(self.sections))
+
+    def _advance(self, completed):
+        newly_completed = list(self.sections[self.completed:completed]) if completed > self.completed else []
+        self.completed = max(self.completed, completed)
+        return newly_completed
+
+    @property
+    def html(self):
+        return self.buffer
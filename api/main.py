@@ -1,22 +1,69 @@
 import os
 import asyncio
-import io
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
 import json
 import uuid
-import urllib.parse
-import httpx
 
-from google import genai
-from fastapi import FastAPI, HTTPException, Request, Query
-from fastapi.responses import HTMLResponse, Response
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Query, Header
+from fastapi.responses import HTMLResponse, Response, FileResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 from datetime import datetime
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional, Dict, Any
 from bson import ObjectId
-from weasyprint import HTML, CSS
-
+from users_repo import (
+    create_user_repository,
+    PROFILE_PROJECTION,
+    LESSON_REQUEST_PROJECTION,
+)
+from lessons import (
+    build_lesson_prompt,
+    lesson_key,
+    normalize_lesson_params,
+    LessonSectionTracker,
+    LESSON_SECTIONS,
+    GENERATION_MODES,
+    GENERATION_PARALLEL,
+)
+from parallel_lessons import ParallelLessonGenerator
+from translation import LessonTranslator
+from lesson_cache import CachedLesson, LessonCache, MemoryLessonCache, MongoLessonCache
+from renderer import PdfRenderer, RendererBusy, RenderTimeout
+from jobs import LessonJobQueue, JobDeferred, public_job, JOB_DONE
+from history import LessonHistory, public_lesson
+from write_buffer import UserWriteBuffer
+from bot_notifier import BotNotifier
+from admission import GeminiAdmission, AdmissionRejected
+from singleflight import SingleFlight, MongoLeaseLock
+from speculation import LessonSpeculator
+from storage import PdfStore, StorageFull
+from warmup import StartupState
+from resilience import (
+    Dependency,
+    DependencyError,
+    CircuitOpen,
+    DeadlineExceeded,
+    set_deadline,
+    current_deadline,
+    within_deadline,
+    transient_http_error,
+)
+from metrics import (
+    registry,
+    current_request_id,
+    stage,
+    record_gemini_usage,
+    HTTP_REQUESTS,
+    HTTP_SECONDS,
+    HTTP_IN_FLIGHT,
+    GENERATIONS_IN_FLIGHT,
+    PDF_BYTES,
+)
 
 
 load_dotenv()
@@ -24,13 +71,264 @@ MONGO_DB = os.getenv("MONGO_DB")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MONGO_API_URL = os.getenv("MONGO_API_URL")
 MONGO_URL = os.getenv("MONGO_URL")
-gemini_client = genai.Client()
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "Studiora")
+USER_BACKEND = os.getenv("USER_BACKEND", "motor")
+LESSON_CACHE_TTL = int(os.getenv("LESSON_CACHE_TTL", 7 * 24 * 3600))
+LESSON_CACHE_MAX_ENTRIES = int(os.getenv("LESSON_CACHE_MAX_ENTRIES", 256))
+LESSON_CACHE_MAX_BYTES = int(os.getenv("LESSON_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+LESSON_CACHE_SHARED_MAX_BYTES = int(os.getenv("LESSON_CACHE_SHARED_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+LESSON_CACHE_SHARED = os.getenv("LESSON_CACHE_SHARED", "1") == "1"
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", 60))
+PDF_MAX_QUEUE = int(os.getenv("PDF_MAX_QUEUE", 32))
+PDF_MAX_RENDERS_PER_WORKER = int(os.getenv("PDF_MAX_RENDERS_PER_WORKER", 200))
+PDF_BASE_CSS = os.getenv("PDF_BASE_CSS")
+LESSON_JOB_WORKERS = int(os.getenv("LESSON_JOB_WORKERS", 4))
+LESSON_JOB_MAX_ATTEMPTS = int(os.getenv("LESSON_JOB_MAX_ATTEMPTS", 3))
+BOT_CALLBACK_URL = os.getenv("BOT_CALLBACK_URL")
+BOT_CALLBACK_SECRET = os.getenv("BOT_CALLBACK_SECRET")
+BOT_INTERNAL_URL = os.getenv("BOT_INTERNAL_URL")
+LESSON_STREAMING = os.getenv("LESSON_STREAMING", "1") == "1"
+LESSON_GENERATION_MODE = os.getenv("LESSON_GENERATION_MODE", "monolithic")
+LESSON_SECTION_CONCURRENCY = int(os.getenv("LESSON_SECTION_CONCURRENCY", 6))
+LESSON_SECTION_ATTEMPTS = int(os.getenv("LESSON_SECTION_ATTEMPTS", 2))
+LESSON_TRANSLATION = os.getenv("LESSON_TRANSLATION", "1") == "1"
+USER_WRITE_FLUSH_INTERVAL = float(os.getenv("USER_WRITE_FLUSH_INTERVAL", 0.02))
+USER_WRITE_MAX_BATCH = int(os.getenv("USER_WRITE_MAX_BATCH", 500))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", 1000000))
+GEMINI_PER_USER_LIMIT = int(os.getenv("GEMINI_PER_USER_LIMIT", 1))
+GEMINI_MAX_WAIT = float(os.getenv("GEMINI_MAX_WAIT", 30))
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", 100))
+GEMINI_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("GEMINI_OUTPUT_TOKENS_ESTIMATE", 8192))
+LESSON_LOCK_TTL = float(os.getenv("LESSON_LOCK_TTL", 120))
+LESSON_LOCK_POLL_INTERVAL = float(os.getenv("LESSON_LOCK_POLL_INTERVAL", 1.0))
+LESSON_SPECULATION = os.getenv("LESSON_SPECULATION", "0") == "1"
+LESSON_SPECULATION_MAX_IN_FLIGHT = int(os.getenv("LESSON_SPECULATION_MAX_IN_FLIGHT", 4))
+LESSON_SPECULATION_TIMEOUT = float(os.getenv("LESSON_SPECULATION_TIMEOUT", 120))
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", "db")
+STORAGE_USER_QUOTA_BYTES = int(os.getenv("STORAGE_USER_QUOTA_BYTES", 0))
+STORAGE_GLOBAL_QUOTA_BYTES = int(os.getenv("STORAGE_GLOBAL_QUOTA_BYTES", 0))
+STORAGE_ARCHIVE_AFTER_DAYS = float(os.getenv("STORAGE_ARCHIVE_AFTER_DAYS", 30))
+STORAGE_GC_INTERVAL = float(os.getenv("STORAGE_GC_INTERVAL", 3600))
+STARTUP_WARMUP_TIMEOUT = float(os.getenv("STARTUP_WARMUP_TIMEOUT", 60))
+STARTUP_RETRY_INTERVAL = float(os.getenv("STARTUP_RETRY_INTERVAL", 5))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 0))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", 3))
+GEMINI_ATTEMPT_TIMEOUT = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT", 120))
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "0") == "1"
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", 5))
+GEMINI_BREAKER_RESET = float(os.getenv("GEMINI_BREAKER_RESET", 30))
+MONGO_PROXY_MAX_ATTEMPTS = int(os.getenv("MONGO_PROXY_MAX_ATTEMPTS", 3))
+MONGO_PROXY_ATTEMPT_TIMEOUT = float(os.getenv("MONGO_PROXY_ATTEMPT_TIMEOUT", 5))
+MONGO_PROXY_HEDGE = os.getenv("MONGO_PROXY_HEDGE", "0") == "1"
+MONGO_PROXY_BREAKER_THRESHOLD = int(os.getenv("MONGO_PROXY_BREAKER_THRESHOLD", 5))
+MONGO_PROXY_BREAKER_RESET = float(os.getenv("MONGO_PROXY_BREAKER_RESET", 10))
+startup_state = StartupState(STARTUP_WARMUP_TIMEOUT, STARTUP_RETRY_INTERVAL)
+gemini_client = None
+owned_gemini_client = None
+gemini_client_lock = asyncio.Lock()
 model_id = "gemini-2.5-flash"
 
-mongo_client = AsyncIOMotorClient(MONGO_DB)
-db = mongo_client.get_database()
+def transient_gemini_error(error):
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    return transient_http_error(error)
+
+gemini_dependency = Dependency(
+    "gemini",
+    is_transient=transient_gemini_error,
+    max_attempts=GEMINI_MAX_ATTEMPTS,
+    attempt_timeout=GEMINI_ATTEMPT_TIMEOUT,
+    base_delay=1.0,
+    max_delay=10.0,
+    hedge=GEMINI_HEDGE,
+    failure_threshold=GEMINI_BREAKER_THRESHOLD,
+    reset_timeout=GEMINI_BREAKER_RESET,
+)
+mongo_proxy_dependency = Dependency(
+    "mongo_proxy",
+    max_attempts=MONGO_PROXY_MAX_ATTEMPTS,
+    attempt_timeout=MONGO_PROXY_ATTEMPT_TIMEOUT,
+    hedge=MONGO_PROXY_HEDGE,
+    failure_threshold=MONGO_PROXY_BREAKER_THRESHOLD,
+    reset_timeout=MONGO_PROXY_BREAKER_RESET,
+)
+gemini_admission = GeminiAdmission(
+    max_concurrency=GEMINI_MAX_CONCURRENCY,
+    tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+    per_user_limit=GEMINI_PER_USER_LIMIT,
+    max_wait=GEMINI_MAX_WAIT,
+    max_queue=GEMINI_MAX_QUEUE,
+)
+
+mongo_client = AsyncIOMotorClient(MONGO_DB, connect=False)
+db = mongo_client.get_database(MONGO_DB_NAME)
+users_repo = create_user_repository(USER_BACKEND, db, MONGO_API_URL, MONGO_URL, MONGO_DB_NAME, mongo_proxy_dependency)
+user_writes = UserWriteBuffer(users_repo, USER_WRITE_FLUSH_INTERVAL, USER_WRITE_MAX_BATCH)
+lesson_cache = LessonCache(
+    MemoryLessonCache(LESSON_CACHE_TTL, LESSON_CACHE_MAX_ENTRIES, LESSON_CACHE_MAX_BYTES),
+    MongoLessonCache(db, LESSON_CACHE_TTL, LESSON_CACHE_SHARED_MAX_BYTES) if LESSON_CACHE_SHARED else None,
+)
+lesson_flights = SingleFlight()
+lesson_locks = MongoLeaseLock(db, LESSON_LOCK_TTL) if LESSON_CACHE_SHARED else None
+lesson_speculator = LessonSpeculator(lesson_flights, LESSON_SPECULATION_MAX_IN_FLIGHT, LESSON_SPECULATION_TIMEOUT)
+pdf_renderer = PdfRenderer(
+    workers=PDF_WORKERS,
+    timeout=PDF_RENDER_TIMEOUT,
+    max_queue=PDF_MAX_QUEUE,
+    max_renders_per_worker=PDF_MAX_RENDERS_PER_WORKER,
+    base_css_path=PDF_BASE_CSS,
+)
+
+async def run_lesson_job(job):
+    current_request_id.set(job.get("request_id"))
+
+    async def on_progress(progress):
+        await lesson_jobs.report_progress(job, progress)
+
+    try:
+        lesson = await generate_lesson(job["telegram_id"], job["params"], on_progress)
+    except (AdmissionRejected, CircuitOpen) as e:
+        raise JobDeferred(e.reason, e.retry_after)
+    return {"filename": lesson["filename"], "lesson_id": lesson["_id"]}
+
+lesson_history = LessonHistory(db)
+
+pdf_store = PdfStore(
+    db,
+    STORAGE_ROOT,
+    user_quota_bytes=STORAGE_USER_QUOTA_BYTES,
+    global_quota_bytes=STORAGE_GLOBAL_QUOTA_BYTES,
+    archive_after_days=STORAGE_ARCHIVE_AFTER_DAYS,
+    gc_interval=STORAGE_GC_INTERVAL,
+)
+bot_notifier = BotNotifier(BOT_INTERNAL_URL, BOT_CALLBACK_SECRET)
+lesson_jobs = LessonJobQueue(
+    db,
+    run_lesson_job,
+    concurrency=LESSON_JOB_WORKERS,
+    max_attempts=LESSON_JOB_MAX_ATTEMPTS,
+    callback_url=BOT_CALLBACK_URL,
+    callback_secret=BOT_CALLBACK_SECRET,
+)
+
+registry.add_snapshot("studiora_lesson_cache", lesson_cache.snapshot)
+registry.add_snapshot("studiora_user_writes", user_writes.snapshot)
+registry.add_snapshot("studiora_pdf_renderer", pdf_renderer.snapshot)
+registry.add_snapshot("studiora_gemini_admission", gemini_admission.snapshot)
+registry.add_snapshot("studiora_singleflight", lesson_flights.snapshot)
+registry.add_snapshot("studiora_speculation", lesson_speculator.snapshot)
+registry.add_snapshot("studiora_storage", pdf_store.snapshot)
+registry.add_snapshot("studiora_startup", startup_state.snapshot)
+registry.add_snapshot("studiora_gemini_resilience", gemini_dependency.snapshot)
+registry.add_snapshot("studiora_mongo_proxy_resilience", mongo_proxy_dependency.snapshot)
+
+def create_gemini_client():
+    genai = startup_state.import_module("google.genai")
+    return genai.Client()
+
+async def get_gemini_client():
+    global gemini_client, owned_gemini_client
+    if gemini_client is None:
+        async with gemini_client_lock:
+            if gemini_client is None:
+                owned_gemini_client = await asyncio.to_thread(create_gemini_client)
+                gemini_client = owned_gemini_client
+    return gemini_client
+
+async def warm_mongo():
+    await db.command("ping")
+    indexes = [
+        users_repo.ensure_indexes(),
+        lesson_cache.ensure_indexes(),
+        lesson_history.ensure_indexes(),
+        pdf_store.ensure_indexes(),
+        lesson_jobs.ensure_indexes(),
+    ]
+    if lesson_locks is not None:
+        indexes.append(lesson_locks.ensure_indexes())
+    await asyncio.gather(*indexes)
+
+@asynccontextmanager
+async def lifespan(app):
+    await user_writes.start()
+    await bot_notifier.start()
+    await startup_state.warm_up({
+        "gemini": get_gemini_client,
+        "mongo": warm_mongo,
+        "renderer": pdf_renderer.start,
+    })
+    await pdf_store.start()
+    await lesson_jobs.start()
+    startup_state.report()
+
+    yield
+
+    await startup_state.drain()
+    await lesson_speculator.close()
+    await pdf_store.close()
+    await lesson_jobs.close()
+    await user_writes.close()
+    await bot_notifier.close()
+    await users_repo.close()
+    await pdf_renderer.close()
+    if owned_gemini_client is not None:
+        await owned_gemini_client.aio.aclose()
+    mongo_client.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = current_request_id.set(request_id)
+    deadline_token = None
+    try:
+        request_timeout = float(request.headers.get("X-Request-Timeout", 0))
+    except ValueError:
+        request_timeout = 0
+    if REQUEST_TIMEOUT > 0:
+        request_timeout = min(request_timeout, REQUEST_TIMEOUT) if request_timeout > 0 else REQUEST_TIMEOUT
+    if request_timeout > 0:
+        deadline_token = set_deadline(request_timeout)
+    HTTP_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    except Exception as e:
+        print(f"[{request_id}] {request.method} {request.url.path} failed: {e}")
+        raise
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.inc(request.method, route_path, str(status_code))
+        HTTP_SECONDS.observe(time.perf_counter() - started, request.method, route_path)
+        if deadline_token is not None:
+            current_deadline.reset(deadline_token)
+        current_request_id.reset(token)
+
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
-app = FastAPI()
+@app.exception_handler(DependencyError)
+async def dependency_error_handler(request: Request, exc: DependencyError):
+    if isinstance(exc, DeadlineExceeded):
+        return JSONResponse(status_code=504, content={"detail": str(exc)})
+    headers = {"Retry-After": str(round(exc.retry_after))} if exc.retry_after else {}
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers=headers)
 
 class LastRequestData(BaseModel):
     topic: str
@@ -75,76 +373,39 @@ class UserData(BaseModel):
         }
     }
 
+class LessonJobRequest(BaseModel):
+    telegram_id: int
+    generation_mode: str | None = None
+
 class UserUpdateData(BaseModel):
     username: Optional[str] = None
     first_name: Optional[str] = None
     last_name: Optional[str] = None
     language_code: Optional[str] = None
 
-async def getUser(id, limit=0, skip=0):
-    async with httpx.AsyncClient() as client:
-        url = f"{MONGO_API_URL}?mongo_url={MONGO_URL}&db_name=Studiora&collection_name=users"
-        mongo_filter = {"_id": id}
-
-        filter_json_str = json.dumps(mongo_filter)
-        encoded_filter = urllib.parse.quote_plus(filter_json_str)
-
-        url += f"&filter_json={encoded_filter}"
-        url += f"&limit={limit}&skip={skip}"
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            user= (response.json())["data"][0] if (response.json())["count"] > 0 else None
-        except Exception as e:
-            print(f"Fetch error: {e}")
-            raise HTTPException(status_code=500, detail="Fetch error.")
-    
-        return user
+async def getUser(id, projection=None):
+    with stage("user_read"):
+        if user_writes.has_pending(id):
+            await user_writes.flush([id])
+        return await users_repo.get(id, projection)
     
-async def updateUser(telegram_id, update_data):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.patch(MONGO_API_URL, json={
-                "db_name": "Studiora",
-                "collection_name": "users",
-                "filter":{"_id": telegram_id},
-                "update":update_data,
-                "mongo_url": MONGO_URL
-            })
-            response.raise_for_status()
-            print(response.json())
-        except Exception as e:
-            print(f"Fetch error: {e}")
-            raise HTTPException(status_code=500, detail="Fetch error.")
+async def updateUser(telegram_id, update_data, flush=False):
+    with stage("user_write"):
+        await user_writes.update(telegram_id, update_data, flush=flush)
     
     
 @app.post("/users")
 async def create_user(user: UserData):
-    existing_user = await getUser(user.telegram_id)
-
-    if not existing_user:
-        user_data_dict = user.model_dump()
-        user_data_dict["_id"] = user_data_dict["telegram_id"]
-        del user_data_dict["telegram_id"]
-
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(MONGO_API_URL, json={
-                    "db_name": "Studiora",
-                    "collection_name": "users",
-                    "data": user_data_dict,
-                    "mongo_url": MONGO_URL
-                })
-                response.raise_for_status()
-            except Exception as e:
-                print(f"Fetch error: {e}")
-                raise HTTPException(status_code=500, detail="Fetch error.")
+    user_data_dict = user.model_dump()
+    del user_data_dict["telegram_id"]
+
+    await users_repo.create_if_missing(user.telegram_id, user_data_dict)
 
     return {"message": "User created or already existed"}
     
 @app.get("/users/{telegram_id}", response_model=UserData)
 async def get_user_data(telegram_id: int):
-    user = await getUser(telegram_id)
+    user = await getUser(telegram_id, PROFILE_PROJECTION)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -162,127 +423,471 @@ async def update_user_language(telegram_id: int, lang_update: UserLanguageUpdate
     return {"message": "User language update attempted"}
 
 
-@app.get("/users/{telegram_id}/lesson_details", response_class=Response)
-async def get_user_lesson_details(telegram_id: int):
-    user = await getUser(telegram_id)
+async def read_lesson_request(telegram_id, generation_mode=None):
+    generation_mode = generation_mode or LESSON_GENERATION_MODE
+    if generation_mode not in GENERATION_MODES:
+        raise HTTPException(status_code=400, detail=f"generation_mode must be one of {', '.join(GENERATION_MODES)}")
+
+    user = await getUser(telegram_id, LESSON_REQUEST_PROJECTION)
+
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
-    lesson_language = user.get('language_code', 'en')
     last_request_data = user.get("last_request")
 
     if isinstance(last_request_data, str):
         last_request_data = json.loads(last_request_data)
 
-    topic = last_request_data.get('topic', 'General Knowledge')
-    current_level = last_request_data.get('current_level', 'Beginner')
-    target_level = last_request_data.get('target_level', 'Intermediate')
-
-    prompt = f"""
-        Create a detailed educational lesson as an HTML document.
-
-        Topic: "{topic}"  
-        Current level: {current_level}  
-        Target level: {target_level}
-        Lesson Language: {lesson_language}
-
-        The lesson must include:
-        1. Introduction
-        2. Key concepts and theory
-        3. Examples with explanations
-        4. Practice exercises (at least 3)
-        5. Summary and study tips
-        6. Self-check questions (5 questions with answers)
-
-        Requirements:
-        - Use **HTML5** only.
-        - Use tags like <h1>, <h2>, <p>, <ul>, <ol>, <li>, <strong>, <em>, <code>, <hr>.
-        - Do not include CSS or JavaScript — pure HTML only.
-        - Do not include <html>, <head>, or <body> tags — only the content inside.
-        - Make sure formatting is clean and suitable for PDF conversion.
-
-        Content must be understandable for a student at {current_level} and help reach {target_level}.
-    """
-
-    response = await gemini_client.aio.models.generate_content(
+    if not last_request_data:
+        raise HTTPException(status_code=400, detail="No lesson request saved")
+
+    return {
+        "topic": last_request_data.get('topic', 'General Knowledge'),
+        "current_level": last_request_data.get('current_level', 'Beginner'),
+        "target_level": last_request_data.get('target_level', 'Intermediate'),
+        "language_code": user.get('language_code', 'en'),
+        "generation_mode": generation_mode,
+    }
+
+def lesson_cache_key(lesson_request):
+    return lesson_key(
+        lesson_request["topic"],
+        lesson_request["current_level"],
+        lesson_request["target_level"],
+        lesson_request["language_code"],
+        lesson_request.get("generation_mode"),
+    )
+
+async def gemini_complete(prompt, config=None):
+    gemini = await get_gemini_client()
+    response = await gemini_dependency.call(lambda: gemini.aio.models.generate_content(
+        model=model_id,
+        contents=prompt,
+        config=config,
+    ))
+    return response.text, record_gemini_usage(response.usage_metadata) or 0
+
+parallel_lessons = ParallelLessonGenerator(gemini_complete, LESSON_SECTION_CONCURRENCY, LESSON_SECTION_ATTEMPTS)
+registry.add_snapshot("studiora_parallel_lessons", parallel_lessons.snapshot)
+lesson_translator = LessonTranslator(gemini_complete, LESSON_SECTION_CONCURRENCY, LESSON_SECTION_ATTEMPTS)
+registry.add_snapshot("studiora_lesson_translation", lesson_translator.snapshot)
+
+async def stream_lesson_html(gemini, prompt, on_progress):
+    tracker = LessonSectionTracker()
+    usage = None
+    stream = await gemini.aio.models.generate_content_stream(
         model=model_id,
         contents=prompt,
     )
+    async for chunk in stream:
+        usage = chunk.usage_metadata or usage
+        if not chunk.text:
+            continue
+        if not tracker.buffer:
+            await on_progress({"stage": "generating", "sections_done": 0, "sections_total": len(LESSON_SECTIONS)})
+        for section in tracker.feed(chunk.text):
+            await on_progress({"stage": "generating", "section": section, "sections_done": tracker.completed, "sections_total": len(LESSON_SECTIONS)})
+    return tracker, usage
+
+async def generate_lesson_html(telegram_id, prompt, on_progress=None):
+    gemini = await get_gemini_client()
+    estimated_tokens = len(prompt) // 4 + GEMINI_OUTPUT_TOKENS_ESTIMATE
+    with stage("gemini_admission"):
+        ticket = await gemini_admission.acquire(telegram_id, estimated_tokens)
+    try:
+        with stage("gemini"):
+            if not LESSON_STREAMING or on_progress is None:
+                response = await gemini_dependency.call(lambda: gemini.aio.models.generate_content(
+                    model=model_id,
+                    contents=prompt,
+                ))
+                ticket.tokens_used = record_gemini_usage(response.usage_metadata)
+                return response.text
+
+            tracker, usage = await gemini_dependency.call(
+                lambda: stream_lesson_html(gemini, prompt, on_progress),
+                hedge=False,
+            )
+            ticket.tokens_used = record_gemini_usage(usage)
+    finally:
+        gemini_admission.release(ticket)
+
+    for section in tracker.finish():
+        await on_progress({"stage": "generating", "section": section, "sections_done": tracker.completed, "sections_total": len(LESSON_SECTIONS)})
+
+    return tracker.html
+
+async def generate_parallel_lesson_html(telegram_id, lesson_request, on_progress=None):
+    prompt = build_lesson_prompt(
+        lesson_request["topic"],
+        lesson_request["current_level"],
+        lesson_request["target_level"],
+        lesson_request["language_code"],
+    )
+    estimated_tokens = (len(LESSON_SECTIONS) + 1) * (len(prompt) // 4) + GEMINI_OUTPUT_TOKENS_ESTIMATE
+    with stage("gemini_admission"):
+        ticket = await gemini_admission.acquire(telegram_id, estimated_tokens, parallel_lessons.fan_out())
+    try:
+        with stage("gemini"):
+            lesson_html, ticket.tokens_used = await parallel_lessons.generate(lesson_request, on_progress)
+    finally:
+        gemini_admission.release(ticket)
+    return lesson_html
+
+async def translate_cached_lesson(telegram_id, params, on_progress=None):
+    with stage("translation_source"):
+        found = await lesson_cache.find_source(params)
+    if found is None:
+        return None
+    source_key, source = found
+
+    estimated_tokens = len(source.html) // 2 + 1000
+    with stage("gemini_admission"):
+        ticket = await gemini_admission.acquire(telegram_id, estimated_tokens, lesson_translator.fan_out(source.html))
+    try:
+        with stage("gemini"):
+            lesson_html, ticket.tokens_used = await lesson_translator.translate(
+                source.html,
+                source.params["language_code"],
+                params["language_code"],
+                on_progress,
+            )
+    except DependencyError:
+        raise
+    except Exception as e:
+        print(f"Lesson translation failed, generating from scratch: {e}")
+        return None
+    finally:
+        gemini_admission.release(ticket)
+    return source_key, lesson_html
+
+async def create_lesson_content(telegram_id, cache_key, lesson_request, on_progress):
+    topic = lesson_request["topic"]
+    current_level = lesson_request["current_level"]
+    target_level = lesson_request["target_level"]
+    lesson_language = lesson_request["language_code"]
+
+    generation_mode = lesson_request.get("generation_mode")
+    params = normalize_lesson_params(topic, current_level, target_level, lesson_language, generation_mode)
+
+    GENERATIONS_IN_FLIGHT.inc()
+    try:
+        translated = await translate_cached_lesson(telegram_id, params, on_progress) if LESSON_TRANSLATION else None
+        if translated is not None:
+            params["translated_from"], lesson_html = translated
+        elif generation_mode == GENERATION_PARALLEL:
+            lesson_html = await generate_parallel_lesson_html(telegram_id, lesson_request, on_progress)
+        else:
+            prompt = build_lesson_prompt(topic, current_level, target_level, lesson_language)
+            lesson_html = await generate_lesson_html(telegram_id, prompt, on_progress)
 
-    lesson_html = response.text
+        await on_progress({"stage": "rendering", "sections_done": len(LESSON_SECTIONS), "sections_total": len(LESSON_SECTIONS)})
 
-    pdf_bytes = io.BytesIO()
-    HTML(string=lesson_html).write_pdf(pdf_bytes)
-    pdf_bytes.seek(0)
+        try:
+            with stage("pdf_render"):
+                pdf_data = await pdf_renderer.render_pdf(lesson_html)
+        except RendererBusy:
+            raise HTTPException(status_code=503, detail="PDF renderer is busy.", headers={"Retry-After": "5"})
+        except RenderTimeout:
+            raise HTTPException(status_code=504, detail="PDF rendering timed out.")
+        PDF_BYTES.observe(len(pdf_data))
+
+        cached = CachedLesson(lesson_html, pdf_data)
+        with stage("cache_store"):
+            await lesson_cache.put(cache_key, cached, params)
+        return cached
+    finally:
+        GENERATIONS_IN_FLIGHT.dec()
+
+async def produce_lesson(telegram_id, cache_key, lesson_request, on_progress):
+    current_deadline.set(None)
+    if lesson_locks is None:
+        return await create_lesson_content(telegram_id, cache_key, lesson_request, on_progress)
+
+    while True:
+        token = await lesson_locks.acquire(cache_key)
+        if token is not None:
+            async with lesson_locks.hold(cache_key, token):
+                cached = await lesson_cache.fetch_shared(cache_key)
+                if cached is not None:
+                    lesson_flights.record_remote_hit()
+                    return cached
+                return await create_lesson_content(telegram_id, cache_key, lesson_request, on_progress)
+
+        lesson_flights.record_remote_wait()
+        await asyncio.sleep(LESSON_LOCK_POLL_INTERVAL)
+        cached = await lesson_cache.fetch_shared(cache_key)
+        if cached is not None:
+            lesson_flights.record_remote_hit()
+            return cached
+
+async def generate_lesson(telegram_id, lesson_request, on_progress=None):
+    topic = lesson_request["topic"]
+
+    cache_key = lesson_cache_key(lesson_request)
+    lesson_speculator.claim(telegram_id, cache_key)
+    with stage("cache_lookup"):
+        cached = await lesson_cache.get(cache_key)
+
+    if cached is None:
+        cached = await within_deadline(lesson_flights.do(
+            cache_key,
+            lambda publish: produce_lesson(telegram_id, cache_key, lesson_request, publish),
+            on_progress,
+        ), "lesson")
 
     unique_id = str(uuid.uuid4())
     sanitized_topic = "".join(c for c in topic if c.isalnum() or c in (' ', '_')).rstrip()
     filename = f"{sanitized_topic.replace(' ', '_').lower()}_{unique_id}.pdf"
 
-    user_pdf_dir = os.path.join("db", str(telegram_id))
-    os.makedirs(user_pdf_dir, exist_ok=True)
-    file_path = os.path.join(user_pdf_dir, filename)
-
-    with open(file_path, "wb") as f:
-        f.write(pdf_bytes.getvalue())
+    try:
+        with stage("file_write"):
+            content_hash, storage_key = await pdf_store.put(telegram_id, cached.pdf)
+    except StorageFull:
+        raise HTTPException(status_code=507, detail="Lesson storage is full.")
+
+    try:
+        with stage("history_record"):
+            lesson = await lesson_history.record(
+                unique_id,
+                telegram_id,
+                filename,
+                lesson_request,
+                size=len(cached.pdf),
+                storage_key=storage_key,
+                content_hash=content_hash,
+            )
+    except BaseException:
+        await pdf_store.release(telegram_id, content_hash, len(cached.pdf))
+        raise
 
     await updateUser(
         telegram_id,
-        {"$push": {"pdf_files": filename}}
+        {"$inc": {"lesson_count": 1}, "$unset": {"last_request": ""}}
     )
+    bot_notifier.profile_changed(telegram_id, current_request_id.get())
 
-    encoded_filename = urllib.parse.quote(filename)
+    return lesson
 
-    await updateUser(
-        telegram_id,
-        {"$unset": {"last_request": ""}}
-    )
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
 
-    return Response(
-        content=pdf_bytes.getvalue(),
+async def lesson_pdf_response(lesson, if_none_match=None):
+    etag = f'"{lesson["_id"]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    file_path = await pdf_store.path_for(lesson)
+    if file_path is None or not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Lesson file not found")
+
+    return FileResponse(
+        file_path,
         media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename=\"file.pdf\"; filename*=UTF-8''{encoded_filename}"
-        }
+        filename=lesson["filename"],
+        headers=headers,
     )
 
+@app.get("/users/{telegram_id}/lesson_details", response_class=FileResponse)
+async def get_user_lesson_details(telegram_id: int, generation_mode: str | None = None):
+    lesson_request = await read_lesson_request(telegram_id, generation_mode)
+    lesson = await generate_lesson(telegram_id, lesson_request)
+    return await lesson_pdf_response(lesson)
+
+@app.get("/users/{telegram_id}/lessons/{lesson_id}/pdf", response_class=FileResponse)
+async def get_user_lesson_pdf(telegram_id: int, lesson_id: str, if_none_match: str | None = Header(default=None)):
+    lesson = await lesson_history.get(telegram_id, lesson_id)
+
+    if not lesson:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+
+    return await lesson_pdf_response(lesson, if_none_match)
+
+@app.post("/lessons/jobs", status_code=202)
+async def create_lesson_job(job_request: LessonJobRequest, idempotency_key: str | None = Header(default=None)):
+    lesson_request = await read_lesson_request(job_request.telegram_id, job_request.generation_mode)
+
+    if not idempotency_key:
+        idempotency_key = f"{job_request.telegram_id}:" + lesson_cache_key(lesson_request)
+
+    job, created = await lesson_jobs.submit(
+        job_request.telegram_id,
+        lesson_request,
+        idempotency_key,
+        request_id=current_request_id.get(),
+    )
+    return {**public_job(job), "created": created}
+
+@app.get("/lessons/jobs/{job_id}")
+async def get_lesson_job(job_id: str):
+    job = await lesson_jobs.get(job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return public_job(job)
+
+@app.post("/lessons/jobs/{job_id}/delivery")
+async def claim_lesson_job_delivery(job_id: str):
+    job = await lesson_jobs.claim_delivery(job_id)
+
+    if not job:
+        job = await lesson_jobs.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job.get("delivered_at"):
+            raise HTTPException(status_code=409, detail="Job is already delivered")
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+    return public_job(job)
+
+@app.get("/lessons/jobs/{job_id}/pdf", response_class=FileResponse)
+async def get_lesson_job_pdf(job_id: str, if_none_match: str | None = Header(default=None)):
+    job = await lesson_jobs.get(job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != JOB_DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+    lesson = await lesson_history.get(job["telegram_id"], job["result"].get("lesson_id"))
+    if lesson is None:
+        filename = job["result"]["filename"]
+        lesson = {"_id": job["_id"], "filename": filename, "storage_key": f"{job['telegram_id']}/{filename}"}
+
+    return await lesson_pdf_response(lesson, if_none_match)
+
+@app.get("/ready")
+async def get_ready():
+    return JSONResponse(status_code=200 if startup_state.ready else 503, content=startup_state.snapshot())
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/lessons/cache/stats")
+async def get_lesson_cache_stats():
+    return lesson_cache.snapshot()
+
+@app.get("/users/writes/stats")
+async def get_user_write_stats():
+    return user_writes.snapshot()
+
+@app.get("/lessons/renderer/stats")
+async def get_renderer_stats():
+    return pdf_renderer.snapshot()
+
+@app.get("/lessons/singleflight/stats")
+async def get_singleflight_stats():
+    return lesson_flights.snapshot()
+
+@app.get("/lessons/parallel/stats")
+async def get_parallel_lesson_stats():
+    return parallel_lessons.snapshot()
+
+@app.get("/lessons/translation/stats")
+async def get_lesson_translation_stats():
+    return lesson_translator.snapshot()
+
+@app.get("/lessons/speculation/stats")
+async def get_speculation_stats():
+    return lesson_speculator.snapshot()
+
+@app.get("/dependencies/stats")
+async def get_dependency_stats():
+    return {
+        "gemini": gemini_dependency.snapshot(),
+        "mongo_proxy": mongo_proxy_dependency.snapshot(),
+    }
+
+@app.get("/lessons/admission/stats")
+async def get_admission_stats():
+    return gemini_admission.snapshot()
+
 @app.post("/users/{telegram_id}/last_request")
 async def save_last_request(telegram_id: int, request: Request):
         data = await request.json()
 
         if not data or not any(data.values()):
+            last_request = None
             update_operation = {"$unset": {"last_request": ""}}
         else:
-            update_operation = {"$set": {"last_request": {
+            last_request = {
                 "topic": data.get("topic", ""),
                 "current_level": data.get("current_level", ""),
                 "target_level": data.get("target_level", "")
-            }}}
+            }
+            update_operation = {"$set": {"last_request": last_request}}
         
         await updateUser(
             telegram_id,
-            update_operation
+            update_operation,
+            flush=True
         )
 
-        return {"message": "Last request saved successfully"}
+        if LESSON_SPECULATION:
+            await speculate_lesson(telegram_id, "$set" in update_operation)
 
+        return {"message": "Last request saved successfully", "last_request": last_request}
 
-@app.get("/users/{user_id}/history")
-async def get_user_history(user_id: int, skip: int = 0, limit: int = 5):
-    user_dir = os.path.join("db", str(user_id))
-    if not os.path.exists(user_dir):
-        return {"pdf_files": [], "total_count": 0}
-    
-    all_files_with_timestamps = []
-    for f in os.listdir(user_dir):
-        if f.endswith(".pdf"):
-            file_path = os.path.join(user_dir, f)
-            timestamp = os.path.getmtime(file_path)
-            all_files_with_timestamps.append((f, timestamp))
-
-    all_files_with_timestamps.sort(key=lambda x: x[1], reverse=True)
-    
-    pdf_files = [f_name for f_name, _ in all_files_with_timestamps]
+async def speculate_lesson(telegram_id, saved):
+    if not saved:
+        lesson_speculator.cancel(telegram_id)
+        return
+
+    lesson_request = await read_lesson_request(telegram_id)
+    if not all(lesson_request[field] for field in ("topic", "current_level", "target_level")):
+        lesson_speculator.cancel(telegram_id)
+        return
 
-    total_count = len(pdf_files)
-    paginated_files = pdf_files[skip:skip + limit]
+    cache_key = lesson_cache_key(lesson_request)
+    if await lesson_cache.get(cache_key) is not None:
+        lesson_speculator.skip_cached(telegram_id)
+        return
+
+    lesson_speculator.start(
+        telegram_id,
+        cache_key,
+        lambda publish: produce_lesson(telegram_id, cache_key, lesson_request, publish),
+        gemini_admission.has_capacity,
+    )
+
+
+@app.get("/users/{user_id}/history")
+async def get_user_history(
+    user_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(5, ge=1, le=100),
+    cursor: str | None = None,
+    topic: str | None = None,
+    language_code: str | None = None,
+):
+    user = await getUser(user_id, {"lesson_count": 1})
+    if not user:
+        return {"pdf_files": [], "lessons": [], "total_count": 0, "next_cursor": None}
+
+    try:
+        page = await lesson_history.page(
+            user_id,
+            limit,
+            skip=skip,
+            cursor=cursor,
+            topic=topic,
+            language_code=language_code,
+            known_total=user.get("lesson_count"),
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return {
+        "pdf_files": [lesson["filename"] for lesson in page["lessons"]],
+        "lessons": [public_lesson(lesson) for lesson in page["lessons"]],
+        "total_count": page["total_count"],
+        "next_cursor": page["next_cursor"],
+    }
 
-    return {"pdf_files": paginated_files, "total_count": total_count}
\ No newline at end of file
+startup_state.record("import", time.perf_counter() - IMPORT_STARTED)
@@ -0,0 +1,151 @@
+import bisect
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+current_request_id = ContextVar("current_request_id", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = tuple(16 * 1024 * 4 ** i for i in range(7))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield self.name + _labels(self.label_names, label_values), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        state = self.values.get(label_values)
+        if state is None:
+            state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self):
+        for label_values, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket" + _labels(self.label_names, label_values, [("le", bound)]), cumulative
+            yield self.name + "_sum" + _labels(self.label_names, label_values), total
+            yield self.name + "_count" + _labels(self.label_names, label_values), count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.snapshots = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_snapshot(self, prefix, snapshot):
+        self.snapshots.append((prefix, snapshot))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{sample} {value}" for sample, value in metric.samples())
+
+        for prefix, snapshot in self.snapshots:
+            for key, value in snapshot().items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter("studiora_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")))
+HTTP_SECONDS = registry.register(Histogram("studiora_http_request_seconds", "HTTP request latency by route.", ("method", "route")))
+HTTP_IN_FLIGHT = registry.register(Gauge("studiora_http_requests_in_flight", "HTTP requests being handled."))
+STAGE_SECONDS = registry.register(Histogram("studiora_stage_seconds", "Time spent per lesson pipeline stage.", ("stage",)))
+STAGE_ERRORS = registry.register(Counter("studiora_stage_errors_total", "Errors per lesson pipeline stage.", ("stage",)))
+GENERATIONS_IN_FLIGHT = registry.register(Gauge("studiora_lesson_generations_in_flight", "Lessons being generated."))
+GEMINI_TOKENS = registry.register(Counter("studiora_gemini_tokens_total", "Gemini tokens from response usage metadata.", ("kind",)))
+PDF_BYTES = registry.register(Histogram("studiora_pdf_bytes", "Size of rendered lesson PDFs.", buckets=SIZE_BUCKETS))
+STARTUP_SECONDS = registry.register(Gauge("studiora_startup_seconds", "Time spent per startup phase of this worker.", ("phase",)))
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, name)
+
+
+def record_gemini_usage(usage):
+    if usage is None:
+        return None
+    for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"), ("total", "total_token_count")):
+        count = getattr(usage, field, None)
+        if count:
+            GEMINI_TOKENS.inc(kind, amount=count)
+    return getattr(usage, "total_token_count", None)
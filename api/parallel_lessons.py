@@ -0,0 +1,64 @@
+from fanout import run_sections
+from lessons import (
+    LESSON_SECTIONS,
+    assemble_lesson,
+    build_outline_prompt,
+    build_section_prompt,
+    clean_section_html,
+    parse_outline,
+)
+from metrics import stage
+
+
+class ParallelLessonGenerator:
+    def __init__(self, complete, max_concurrency=6, section_attempts=2):
+        self.complete = complete
+        self.max_concurrency = max(1, max_concurrency)
+        self.section_attempts = max(1, section_attempts)
+        self.stats = {"lessons": 0, "outline_fallbacks": 0, "sections": 0, "section_retries": 0, "section_failures": 0}
+
+    def fan_out(self):
+        return min(self.max_concurrency, len(LESSON_SECTIONS))
+
+    async def generate(self, lesson_request, on_progress=None):
+        topic = lesson_request["topic"]
+        current_level = lesson_request["current_level"]
+        target_level = lesson_request["target_level"]
+        lesson_language = lesson_request["language_code"]
+
+        with stage("lesson_outline"):
+            text, tokens = await self.complete(
+                build_outline_prompt(topic, current_level, target_level, lesson_language),
+                {"response_mime_type": "application/json"},
+            )
+        outline = parse_outline(text, topic)
+        if not any(item["points"] for item in outline["sections"]):
+            self.stats["outline_fallbacks"] += 1
+
+        used = [tokens]
+
+        async def write_section(section):
+            prompt = build_section_prompt(section, outline, topic, current_level, target_level, lesson_language)
+            with stage("lesson_section"):
+                text, tokens = await self.complete(prompt)
+            used.append(tokens)
+            body = clean_section_html(text)
+            if not body:
+                raise ValueError(f"empty {section} section")
+            return body
+
+        async def report(section=None, done=0):
+            if on_progress is not None:
+                progress = {"stage": "generating", "sections_done": done, "sections_total": len(LESSON_SECTIONS)}
+                if section is not None:
+                    progress["section"] = section
+                await on_progress(progress)
+
+        await report()
+        bodies = await run_sections(LESSON_SECTIONS, write_section, self.max_concurrency, self.section_attempts, self.stats, report)
+
+        self.stats["lessons"] += 1
+        return assemble_lesson(outline, bodies), sum(used)
+
+    def snapshot(self):
+        return {**self.stats, "max_concurrency": self.max_concurrency}
@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+_font_config = None
+_stylesheets = []
+
+
+def _init_worker(base_css_path):
+    global _font_config, _stylesheets
+    from weasyprint import HTML, CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    _font_config = FontConfiguration()
+    if base_css_path:
+        _stylesheets = [CSS(filename=base_css_path, font_config=_font_config)]
+    HTML(string="<p>warmup</p>").write_pdf(stylesheets=_stylesheets, font_config=_font_config)
+
+
+def _render(html):
+    from weasyprint import HTML
+
+    return HTML(string=html).write_pdf(stylesheets=_stylesheets, font_config=_font_config)
+
+
+def _ping():
+    return True
+
+
+class RendererBusy(Exception):
+    pass
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+class PdfRenderer:
+    def __init__(self, workers, timeout, max_queue, max_renders_per_worker, base_css_path=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.max_renders_per_worker = max_renders_per_worker
+        self.base_css_path = base_css_path
+        self.executor = None
+        self.pending = 0
+        self.stats = {"rendered": 0, "rejected": 0, "timeouts": 0, "failures": 0, "restarts": 0, "retried": 0}
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.base_css_path,),
+            max_tasks_per_child=self.max_renders_per_worker,
+        )
+
+    async def start(self):
+        if self.executor is None:
+            self.executor = self._create_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _ping) for _ in range(self.workers)
+        ))
+
+    async def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _restart(self, failed_executor):
+        if self.executor is not failed_executor:
+            return
+        old_executor = self.executor
+        self.executor = self._create_executor()
+        self.stats["restarts"] += 1
+        if old_executor is not None:
+            # ProcessPoolExecutor has no public way to stop a hung worker, and shutdown() alone
+            # leaves it rendering; fall back to plain shutdown if the private attribute goes away.
+            processes = list((getattr(old_executor, "_processes", None) or {}).values())
+            old_executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.kill()
+
+    async def render_pdf(self, html):
+        if self.pending >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise RendererBusy(f"{self.pending} renders already queued")
+
+        self.pending += 1
+        try:
+            pdf = await self._render_once(html, retry=True)
+        finally:
+            self.pending -= 1
+
+        self.stats["rendered"] += 1
+        return pdf
+
+    async def _render_once(self, html, retry):
+        if self.executor is None:
+            self.executor = self._create_executor()
+
+        executor = self.executor
+        try:
+            future = asyncio.get_running_loop().run_in_executor(executor, _render, html)
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            self._restart(executor)
+            raise RenderTimeout(f"PDF rendering exceeded {self.timeout}s")
+        except BrokenProcessPool as e:
+            if retry and executor is not self.executor:
+                self.stats["retried"] += 1
+                return await self._render_once(html, retry=False)
+            self.stats["failures"] += 1
+            self._restart(executor)
+            raise RendererBusy("PDF renderer pool broke, try again") from e
+
+    def snapshot(self):
+        return {**self.stats, "workers": self.workers, "pending": self.pending, "max_queue": self.max_queue}
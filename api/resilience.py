@@ -0,0 +1,272 @@
+import asyncio
+import random
+import time
+
+from collections import deque
+from contextvars import ContextVar
+
+import httpx
+
+
+current_deadline = ContextVar("current_deadline", default=None)
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class DependencyError(Exception):
+    def __init__(self, dependency, reason, retry_after=None):
+        super().__init__(f"{dependency}: {reason}")
+        self.dependency = dependency
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitOpen(DependencyError):
+    pass
+
+
+class DeadlineExceeded(DependencyError):
+    pass
+
+
+def remaining():
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def set_deadline(seconds):
+    deadline = time.monotonic() + seconds
+    current = current_deadline.get()
+    return current_deadline.set(deadline if current is None else min(current, deadline))
+
+
+async def within_deadline(awaitable, name):
+    timeout = remaining()
+    if timeout is None:
+        return await awaitable
+    try:
+        async with asyncio.timeout(max(0, timeout)):
+            return await awaitable
+    except TimeoutError:
+        raise DeadlineExceeded(name, "request deadline exceeded")
+
+
+def transient_http_error(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TransportError, TimeoutError))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+
+    def before_call(self, name):
+        if self.state == BREAKER_OPEN:
+            wait = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if wait > 0:
+                raise CircuitOpen(name, "circuit breaker is open", retry_after=max(1, round(wait)))
+            self.state = BREAKER_HALF_OPEN
+        if self.state == BREAKER_HALF_OPEN:
+            if self.probing:
+                raise CircuitOpen(name, "circuit breaker is probing", retry_after=1)
+            self.probing = True
+
+    def on_success(self):
+        self.failures = 0
+        self.probing = False
+        self.state = BREAKER_CLOSED
+
+    def on_failure(self):
+        self.probing = False
+        self.failures += 1
+        if self.state == BREAKER_HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != BREAKER_OPEN:
+                self.times_opened += 1
+            self.state = BREAKER_OPEN
+            self.opened_at = time.monotonic()
+
+    def on_abort(self):
+        self.probing = False
+
+
+class RetryBudget:
+    def __init__(self, ratio=0.1, max_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = float(max_tokens)
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LatencyWindow:
+    def __init__(self, size=200, min_samples=20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Dependency:
+    def __init__(
+        self,
+        name,
+        is_transient=transient_http_error,
+        max_attempts=3,
+        attempt_timeout=None,
+        base_delay=0.1,
+        max_delay=2.0,
+        hedge=False,
+        hedge_percentile=0.95,
+        failure_threshold=5,
+        reset_timeout=30,
+    ):
+        self.name = name
+        self.is_transient = is_transient
+        self.max_attempts = max(1, max_attempts)
+        self.attempt_timeout = attempt_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.budget = RetryBudget()
+        self.latency = LatencyWindow()
+        self.stats = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "retries_throttled": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "rejected_open": 0,
+            "deadline_exceeded": 0,
+        }
+
+    def _timeout(self):
+        budget = remaining()
+        if budget is not None and budget <= 0:
+            self.stats["deadline_exceeded"] += 1
+            raise DeadlineExceeded(self.name, "request deadline already passed")
+        if budget is None:
+            return self.attempt_timeout, False
+        if self.attempt_timeout is None or budget < self.attempt_timeout:
+            return budget, True
+        return self.attempt_timeout, False
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _hedged(self, operation):
+        delay = self.latency.percentile(self.hedge_percentile)
+        primary = asyncio.ensure_future(operation())
+        tasks = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.budget.withdraw():
+                    self.stats["hedges"] += 1
+                    tasks.add(asyncio.ensure_future(operation()))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, operation, idempotent=True, hedge=True):
+        attempts = self.max_attempts if idempotent else 1
+        hedged = hedge and self.hedge and idempotent
+        for attempt in range(attempts):
+            timeout, deadline_bound = self._timeout()
+            try:
+                self.breaker.before_call(self.name)
+            except CircuitOpen:
+                self.stats["rejected_open"] += 1
+                raise
+            self.stats["calls"] += 1
+            started = time.monotonic()
+            try:
+                async with asyncio.timeout(timeout):
+                    result = await (self._hedged(operation) if hedged else operation())
+            except TimeoutError as e:
+                if deadline_bound:
+                    self.breaker.on_abort()
+                    self.stats["deadline_exceeded"] += 1
+                    raise DeadlineExceeded(self.name, f"request deadline of {timeout:.1f}s exceeded") from e
+                error = e
+            except asyncio.CancelledError:
+                self.breaker.on_abort()
+                raise
+            except Exception as e:
+                if not self.is_transient(e):
+                    self.breaker.on_success()
+                    raise
+                error = e
+            else:
+                self.breaker.on_success()
+                self.budget.deposit()
+                self.latency.observe(time.monotonic() - started)
+                return result
+
+            self.breaker.on_failure()
+            self.stats["failures"] += 1
+            reason = f"{type(error).__name__}: {error}"
+            if attempt + 1 >= attempts:
+                raise DependencyError(self.name, reason, retry_after=self.breaker.reset_timeout) from error
+
+            delay = self._backoff(attempt)
+            budget = remaining()
+            if budget is not None and budget <= delay:
+                self.stats["deadline_exceeded"] += 1
+                raise DeadlineExceeded(self.name, reason) from error
+            if not self.budget.withdraw():
+                self.stats["retries_throttled"] += 1
+                raise DependencyError(self.name, reason, retry_after=self.breaker.reset_timeout) from error
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    def snapshot(self):
+        return {
+            **self.stats,
+            "state": self.breaker.state,
+            "open": self.breaker.state == BREAKER_OPEN,
+            "half_open": self.breaker.state == BREAKER_HALF_OPEN,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.times_opened,
+            "retry_budget": round(self.budget.tokens, 2),
+            "p95_seconds": self.latency.percentile(0.95) or 0.0,
+        }
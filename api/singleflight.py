@@ -0,0 +1,141 @@
+import asyncio
+import uuid
+
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+
+LESSON_LOCKS_COLLECTION = "lesson_locks"
+
+
+class Flight:
+    __slots__ = ("task", "listeners", "waiters", "pending", "flusher", "background")
+
+    def __init__(self, background):
+        self.task = None
+        self.listeners = []
+        self.waiters = 0
+        self.pending = None
+        self.flusher = None
+        self.background = background
+
+    async def publish(self, progress):
+        self.pending = progress
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._flush())
+            self.background.add(self.flusher)
+            self.flusher.add_done_callback(self.background.discard)
+
+    async def _flush(self):
+        while self.pending is not None:
+            progress, self.pending = self.pending, None
+            for listener in list(self.listeners):
+                try:
+                    await listener(progress)
+                except Exception as e:
+                    print(f"Progress listener error: {e}")
+
+
+class SingleFlight:
+    def __init__(self):
+        self.flights = {}
+        self.background = set()
+        self.stats = {"leaders": 0, "followers": 0, "cancelled_waiters": 0, "abandoned": 0, "remote_waits": 0, "remote_hits": 0}
+
+    async def do(self, key, produce, on_progress=None):
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = Flight(self.background)
+            flight.task = asyncio.create_task(produce(flight.publish))
+            flight.task.add_done_callback(lambda task: self._finished(key, flight))
+            self.flights[key] = flight
+            self.stats["leaders"] += 1
+        else:
+            self.stats["followers"] += 1
+
+        if on_progress is not None:
+            flight.listeners.append(on_progress)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done():
+                self.stats["cancelled_waiters"] += 1
+            raise
+        finally:
+            flight.waiters -= 1
+            if on_progress is not None and on_progress in flight.listeners:
+                flight.listeners.remove(on_progress)
+
+    def abandon(self, key):
+        flight = self.flights.get(key)
+        if flight is None or flight.waiters or flight.task.done():
+            return False
+        flight.task.cancel()
+        self.stats["abandoned"] += 1
+        return True
+
+    def record_remote_wait(self):
+        self.stats["remote_waits"] += 1
+
+    def record_remote_hit(self):
+        self.stats["remote_hits"] += 1
+
+    def _finished(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def snapshot(self):
+        return {**self.stats, "in_flight": len(self.flights)}
+
+
+class MongoLeaseLock:
+    def __init__(self, db, ttl_seconds):
+        self.collection = db[LESSON_LOCKS_COLLECTION]
+        self.ttl_seconds = ttl_seconds
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+
+    async def acquire(self, key):
+        token = uuid.uuid4().hex
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        try:
+            await self.collection.insert_one({"_id": key, "owner": token, "expires_at": expires_at})
+            return token
+        except DuplicateKeyError:
+            pass
+
+        stolen = await self.collection.find_one_and_update(
+            {"_id": key, "expires_at": {"$lt": now}},
+            {"$set": {"owner": token, "expires_at": expires_at}},
+        )
+        return token if stolen is not None else None
+
+    async def release(self, key, token):
+        await self.collection.delete_one({"_id": key, "owner": token})
+
+    async def _renew(self, key, token):
+        while True:
+            await asyncio.sleep(self.ttl_seconds / 3)
+            await self.collection.update_one(
+                {"_id": key, "owner": token},
+                {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)}},
+            )
+
+    @asynccontextmanager
+    async def hold(self, key, token):
+        heartbeat = asyncio.create_task(self._renew(key, token))
+        try:
+            yield
+        finally:
+            heartbeat.cancel()
+            try:
+                await self.release(key, token)
+            except Exception as e:
+                print(f"Lesson lock release error: {e}")
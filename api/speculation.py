@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+
+class Speculation:
+    __slots__ = ("cache_key", "task", "started_at", "finished_at", "succeeded")
+
+    def __init__(self, cache_key):
+        self.cache_key = cache_key
+        self.task = None
+        self.succeeded = False
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class LessonSpeculator:
+    def __init__(self, flights, max_in_flight, timeout, retention=3600):
+        self.flights = flights
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.retention = retention
+        self.speculations = {}
+        self.stats = {
+            "started": 0,
+            "skipped_cached": 0,
+            "skipped_busy": 0,
+            "skipped_budget": 0,
+            "completed": 0,
+            "failed": 0,
+            "timed_out": 0,
+            "used_in_flight": 0,
+            "used_finished": 0,
+            "cancelled_in_flight": 0,
+            "wasted_finished": 0,
+            "wasted_seconds": 0.0,
+            "saved_seconds": 0.0,
+        }
+
+    def running(self):
+        return sum(1 for speculation in self.speculations.values() if speculation.finished_at is None)
+
+    def start(self, telegram_id, cache_key, produce, has_capacity):
+        current = self.speculations.get(telegram_id)
+        if current is not None and current.cache_key == cache_key:
+            return False
+        self.cancel(telegram_id)
+        self._prune()
+
+        if self.running() >= self.max_in_flight:
+            self.stats["skipped_budget"] += 1
+            return False
+        if not has_capacity():
+            self.stats["skipped_busy"] += 1
+            return False
+
+        speculation = Speculation(cache_key)
+        speculation.task = asyncio.create_task(self._run(speculation, produce))
+        self.speculations[telegram_id] = speculation
+        self.stats["started"] += 1
+        return True
+
+    def skip_cached(self, telegram_id):
+        self.cancel(telegram_id)
+        self.stats["skipped_cached"] += 1
+
+    async def _run(self, speculation, produce):
+        try:
+            await asyncio.wait_for(self.flights.do(speculation.cache_key, produce), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            self.flights.abandon(speculation.cache_key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Speculative lesson generation failed: {e}")
+        else:
+            speculation.succeeded = True
+            self.stats["completed"] += 1
+        finally:
+            speculation.finished_at = time.monotonic()
+
+    def claim(self, telegram_id, cache_key):
+        speculation = self.speculations.get(telegram_id)
+        if speculation is None:
+            return False
+        if speculation.cache_key != cache_key:
+            self.cancel(telegram_id)
+            return False
+
+        del self.speculations[telegram_id]
+        if speculation.finished_at is not None and not speculation.succeeded:
+            return False
+        if speculation.finished_at is None:
+            self.stats["used_in_flight"] += 1
+        else:
+            self.stats["used_finished"] += 1
+        self.stats["saved_seconds"] += speculation.elapsed()
+        return True
+
+    def _prune(self):
+        expired_before = time.monotonic() - self.retention
+        for telegram_id, speculation in list(self.speculations.items()):
+            if speculation.finished_at is not None and speculation.finished_at < expired_before:
+                self.cancel(telegram_id)
+
+    def cancel(self, telegram_id):
+        speculation = self.speculations.pop(telegram_id, None)
+        if speculation is None:
+            return False
+
+        self.stats["wasted_seconds"] += speculation.elapsed()
+        if speculation.finished_at is None:
+            self.stats["cancelled_in_flight"] += 1
+            cache_key = speculation.cache_key
+            speculation.task.add_done_callback(lambda task: self.flights.abandon(cache_key))
+            speculation.task.cancel()
+        else:
+            self.stats["wasted_finished"] += 1
+        return True
+
+    async def close(self):
+        tasks = [speculation.task for speculation in self.speculations.values()]
+        for telegram_id in list(self.speculations):
+            self.cancel(telegram_id)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self):
+        return {**self.stats, "running": self.running(), "tracked_users": len(self.speculations)}
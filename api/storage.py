@@ -0,0 +1,449 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+
+from history import LESSONS_COLLECTION
+
+
+PDF_OBJECTS_COLLECTION = "pdf_objects"
+STORAGE_USAGE_COLLECTION = "storage_usage"
+GLOBAL_USAGE_ID = "global"
+
+OBJECT_HOT = "hot"
+OBJECT_ARCHIVED = "archived"
+OBJECT_DELETING = "deleting"
+OBJECT_MISSING = "missing"
+
+ORPHAN_GRACE = timedelta(hours=1)
+DELETION_WAIT_SECONDS = 30
+
+
+class StorageFull(Exception):
+    pass
+
+
+def shard_path(content_hash, suffix):
+    return os.path.join(content_hash[:2], content_hash[2:4], content_hash + suffix)
+
+
+def write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def copy_atomic(src_path, dst_path, open_src, open_dst):
+    directory = os.path.dirname(dst_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    os.close(fd)
+    try:
+        with open_src(src_path, "rb") as f_in, open_dst(tmp_path, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return os.path.getsize(dst_path)
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def gzip_open(path, mode):
+    return gzip.open(path, mode, compresslevel=6)
+
+
+def remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class PdfStore:
+    def __init__(self, db, root, user_quota_bytes=0, global_quota_bytes=0, archive_after_days=30, gc_interval=3600):
+        self.objects = db[PDF_OBJECTS_COLLECTION]
+        self.usage = db[STORAGE_USAGE_COLLECTION]
+        self.lessons = db[LESSONS_COLLECTION]
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.archive_dir = os.path.join(root, "archive")
+        self.user_quota_bytes = user_quota_bytes
+        self.global_quota_bytes = global_quota_bytes
+        self.archive_after_days = archive_after_days
+        self.gc_interval = gc_interval
+        self.restore_locks = {}
+        self.task = None
+        self.stats = {
+            "writes": 0,
+            "dedup_hits": 0,
+            "rejected_full": 0,
+            "restores": 0,
+            "archived": 0,
+            "orphans_removed": 0,
+            "quota_archived": 0,
+            "gc_runs": 0,
+            "gc_errors": 0,
+            "last_gc_seconds": 0.0,
+            "physical_bytes": 0,
+        }
+
+    def object_key(self, content_hash):
+        return os.path.join("objects", shard_path(content_hash, ".pdf"))
+
+    def object_path(self, content_hash):
+        return os.path.join(self.objects_dir, shard_path(content_hash, ".pdf"))
+
+    def archive_path(self, content_hash):
+        return os.path.join(self.archive_dir, shard_path(content_hash, ".pdf.gz"))
+
+    async def ensure_indexes(self):
+        await self.objects.create_index([("state", ASCENDING), ("last_access", ASCENDING)], name="state_last_access")
+        await self.objects.create_index([("refcount", ASCENDING)], name="refcount")
+        await self.usage.create_index([("bytes", ASCENDING)], name="bytes")
+
+    async def start(self):
+        if self.gc_interval > 0:
+            self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _global_bytes(self):
+        usage = await self.usage.find_one({"_id": GLOBAL_USAGE_ID})
+        self.stats["physical_bytes"] = usage["bytes"] if usage else 0
+        return self.stats["physical_bytes"]
+
+    async def _add_global_bytes(self, delta):
+        if delta:
+            await self.usage.update_one({"_id": GLOBAL_USAGE_ID}, {"$inc": {"bytes": delta}}, upsert=True)
+
+    async def _charge(self, telegram_id, size, lessons):
+        await self.usage.update_one({"_id": telegram_id}, {"$inc": {"bytes": size, "lessons": lessons}}, upsert=True)
+
+    async def put(self, telegram_id, data):
+        content_hash = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        size = len(data)
+
+        if self.global_quota_bytes:
+            known = await self.objects.find_one({"_id": content_hash}, {"_id": 1})
+            if known is None and await self._global_bytes() + size > self.global_quota_bytes:
+                self.stats["rejected_full"] += 1
+                raise StorageFull(f"PDF storage is over its {self.global_quota_bytes} byte quota")
+
+        # The user quota is soft: a put may go over it and collect() archives the user back under it.
+        await self._charge(telegram_id, size, 1)
+        try:
+            await self._store(content_hash, data)
+        except BaseException:
+            await self._charge(telegram_id, -size, -1)
+            raise
+        return content_hash, self.object_key(content_hash)
+
+    async def _store(self, content_hash, data):
+        size = len(data)
+        now = datetime.now(timezone.utc)
+        before = await self.objects.find_one_and_update(
+            {"_id": content_hash},
+            {
+                "$inc": {"refcount": 1},
+                "$set": {"last_access": now},
+                "$setOnInsert": {"size": size, "stored_size": size, "state": OBJECT_HOT, "created_at": now},
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+
+        path = self.object_path(content_hash)
+        if before is None:
+            self.stats["writes"] += 1
+            await asyncio.to_thread(write_atomic, path, data)
+            await self._add_global_bytes(size)
+            return
+
+        self.stats["dedup_hits"] += 1
+        state = before.get("state")
+        if state in (OBJECT_DELETING, OBJECT_MISSING):
+            if state == OBJECT_DELETING:
+                await self._wait_for_deletion(content_hash)
+            await self._rewrite(content_hash, data)
+        elif state == OBJECT_ARCHIVED:
+            await self._restore(content_hash)
+        elif not os.path.exists(path):
+            await asyncio.to_thread(write_atomic, path, data)
+
+    async def _wait_for_deletion(self, content_hash):
+        deadline = time.monotonic() + DELETION_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            doc = await self.objects.find_one({"_id": content_hash}, {"state": 1})
+            if doc is None or doc["state"] != OBJECT_DELETING:
+                return
+            await asyncio.sleep(0.05)
+
+    async def _rewrite(self, content_hash, data):
+        await asyncio.to_thread(write_atomic, self.object_path(content_hash), data)
+        result = await self.objects.update_one(
+            {"_id": content_hash, "state": {"$in": [OBJECT_DELETING, OBJECT_MISSING]}},
+            {"$set": {"state": OBJECT_HOT, "stored_size": len(data)}},
+        )
+        if result.modified_count:
+            await self._add_global_bytes(len(data))
+
+    async def path_for(self, lesson):
+        content_hash = lesson.get("content_hash")
+        if not content_hash:
+            return os.path.join(self.root, lesson["storage_key"])
+
+        doc = await self.objects.find_one_and_update(
+            {"_id": content_hash},
+            {"$set": {"last_access": datetime.now(timezone.utc)}},
+            projection={"state": 1},
+        )
+        if doc is None:
+            return None
+        if doc["state"] == OBJECT_ARCHIVED:
+            await self._restore(content_hash)
+        return self.object_path(content_hash)
+
+    async def _restore(self, content_hash):
+        entry = self.restore_locks.get(content_hash)
+        if entry is None:
+            entry = self.restore_locks[content_hash] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                doc = await self.objects.find_one({"_id": content_hash}, {"state": 1, "size": 1, "stored_size": 1})
+                if doc is None or doc["state"] != OBJECT_ARCHIVED:
+                    return
+                archive_path = self.archive_path(content_hash)
+                await asyncio.to_thread(copy_atomic, archive_path, self.object_path(content_hash), gzip_open, open)
+                result = await self.objects.update_one(
+                    {"_id": content_hash, "state": OBJECT_ARCHIVED},
+                    {"$set": {"state": OBJECT_HOT, "stored_size": doc["size"], "last_access": datetime.now(timezone.utc)}},
+                )
+                if result.modified_count:
+                    await self._add_global_bytes(doc["size"] - doc["stored_size"])
+                    await asyncio.to_thread(remove_file, archive_path)
+                    self.stats["restores"] += 1
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.restore_locks[content_hash]
+
+    async def release(self, telegram_id, content_hash, size):
+        await self.objects.update_one({"_id": content_hash}, {"$inc": {"refcount": -1}})
+        await self._charge(telegram_id, -size, -1)
+
+    async def _archive(self, doc, accessed_before):
+        content_hash = doc["_id"]
+        hot_path = self.object_path(content_hash)
+        archive_path = self.archive_path(content_hash)
+        if not os.path.exists(hot_path):
+            return False
+
+        stored_size = await asyncio.to_thread(copy_atomic, hot_path, archive_path, open, gzip_open)
+        result = await self.objects.update_one(
+            {"_id": content_hash, "state": OBJECT_HOT, "last_access": {"$lt": accessed_before}},
+            {"$set": {"state": OBJECT_ARCHIVED, "stored_size": stored_size}},
+        )
+        if result.modified_count == 0:
+            await asyncio.to_thread(remove_file, archive_path)
+            return False
+
+        await asyncio.to_thread(remove_file, hot_path)
+        await self._add_global_bytes(stored_size - doc.get("stored_size", doc["size"]))
+        self.stats["archived"] += 1
+        return True
+
+    async def _archive_user(self, usage, accessed_before):
+        telegram_id = usage["_id"]
+        lessons = await self.lessons.find(
+            {"telegram_id": telegram_id, "content_hash": {"$exists": True}},
+            {"size": 1, "content_hash": 1},
+        ).sort("created_at", ASCENDING).to_list(length=None)
+        hashes = list({lesson["content_hash"] for lesson in lessons})
+        objects = {doc["_id"]: doc async for doc in self.objects.find({"_id": {"$in": hashes}})}
+
+        # The quota counts the user's lessons whose PDFs are still hot; archived ones stop counting.
+        def hot(lesson):
+            doc = objects.get(lesson["content_hash"])
+            return doc is not None and doc["state"] == OBJECT_HOT
+
+        hot_bytes = sum(lesson.get("size") or 0 for lesson in lessons if hot(lesson))
+        for lesson in lessons:
+            if hot_bytes <= self.user_quota_bytes:
+                break
+            doc = objects.get(lesson["content_hash"])
+            # Shared objects also back other users' lessons, so one user's quota never archives them.
+            if not hot(lesson) or doc.get("refcount", 0) > 1:
+                continue
+            if await self._archive(doc, accessed_before):
+                doc["state"] = OBJECT_ARCHIVED
+                hot_bytes -= lesson.get("size") or 0
+                self.stats["quota_archived"] += 1
+
+        # $inc rather than $set so puts that landed during the scan are not lost.
+        await self._charge(telegram_id, hot_bytes - usage["bytes"], 0)
+
+    async def _remove_orphan(self, doc, touched_before):
+        content_hash = doc["_id"]
+        marked = await self.objects.update_one(
+            {
+                "_id": content_hash,
+                "refcount": {"$lte": 0},
+                "last_access": {"$lt": touched_before},
+                "state": {"$in": [OBJECT_HOT, OBJECT_ARCHIVED]},
+            },
+            {"$set": {"state": OBJECT_DELETING}},
+        )
+        if marked.modified_count == 0:
+            return
+
+        await asyncio.to_thread(remove_file, self.object_path(content_hash))
+        await asyncio.to_thread(remove_file, self.archive_path(content_hash))
+        await self._add_global_bytes(-doc.get("stored_size", doc.get("size", 0)))
+
+        deleted = await self.objects.delete_one({"_id": content_hash, "state": OBJECT_DELETING, "refcount": {"$lte": 0}})
+        if deleted.deleted_count:
+            self.stats["orphans_removed"] += 1
+            return
+        await self.objects.update_one({"_id": content_hash, "state": OBJECT_DELETING}, {"$set": {"state": OBJECT_MISSING}})
+
+    async def _remove_orphans(self, now):
+        touched_before = now - ORPHAN_GRACE
+        orphans = self.objects.find({"refcount": {"$lte": 0}, "last_access": {"$lt": touched_before}}, {"stored_size": 1, "size": 1})
+        async for doc in orphans:
+            await self._remove_orphan(doc, touched_before)
+
+    async def collect(self):
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+
+        recent = now - timedelta(minutes=10)
+
+        if self.user_quota_bytes:
+            over_quota = self.usage.find({"_id": {"$ne": GLOBAL_USAGE_ID}, "bytes": {"$gt": self.user_quota_bytes}})
+            async for usage in over_quota:
+                await self._archive_user(usage, recent)
+
+        await self._remove_orphans(now)
+
+        if self.archive_after_days:
+            cutoff = now - timedelta(days=self.archive_after_days)
+            async for doc in self.objects.find({"state": OBJECT_HOT, "last_access": {"$lt": cutoff}}):
+                await self._archive(doc, cutoff)
+
+        if self.global_quota_bytes:
+            high_watermark = self.global_quota_bytes * 0.9
+            if await self._global_bytes() > high_watermark:
+                coldest = self.objects.find({"state": OBJECT_HOT, "last_access": {"$lt": recent}}).sort("last_access", ASCENDING)
+                async for doc in coldest:
+                    await self._archive(doc, recent)
+                    if await self._global_bytes() <= high_watermark:
+                        break
+
+        await self._global_bytes()
+        self.stats["gc_runs"] += 1
+        self.stats["last_gc_seconds"] = time.monotonic() - started
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            try:
+                await self.collect()
+            except (PyMongoError, OSError) as e:
+                self.stats["gc_errors"] += 1
+                print(f"Storage GC error: {e}")
+
+    def snapshot(self):
+        return {**self.stats, "restoring": len(self.restore_locks)}
+
+
+async def migrate(db, root="db"):
+    store = PdfStore(db, root, gc_interval=0)
+    await store.ensure_indexes()
+    lessons = db[LESSONS_COLLECTION]
+    migrated = 0
+    missing = 0
+
+    async for lesson in lessons.find({"content_hash": {"$exists": False}}, {"telegram_id": 1, "storage_key": 1}):
+        legacy_path = os.path.join(root, lesson["storage_key"])
+        if not os.path.isfile(legacy_path):
+            missing += 1
+            print(f"Missing file for lesson {lesson['_id']}: {legacy_path}")
+            continue
+
+        data = await asyncio.to_thread(read_file, legacy_path)
+        content_hash, storage_key = await store.put(lesson["telegram_id"], data)
+        try:
+            await lessons.update_one(
+                {"_id": lesson["_id"]},
+                {"$set": {"content_hash": content_hash, "storage_key": storage_key, "size": len(data)}},
+            )
+        except BaseException:
+            await store.release(lesson["telegram_id"], content_hash, len(data))
+            raise
+        os.unlink(legacy_path)
+        migrated += 1
+
+    for entry in os.scandir(root):
+        if entry.is_dir() and entry.name.isdigit():
+            try:
+                os.rmdir(entry.path)
+            except OSError:
+                print(f"Left non-empty legacy directory {entry.path} (run `python history.py backfill` first)")
+
+    print(f"Migrated {migrated} lessons, {missing} missing, {store.stats['dedup_hits']} deduplicated")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in (["migrate"], ["gc"]):
+        print("Usage: python storage.py migrate|gc")
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv()
+    mongo_client = AsyncIOMotorClient(os.getenv("MONGO_DB"))
+    database = mongo_client.get_database(os.getenv("MONGO_DB_NAME", "Studiora"))
+    storage_root = os.getenv("STORAGE_ROOT", "db")
+
+    if sys.argv[1] == "migrate":
+        asyncio.run(migrate(database, storage_root))
+    else:
+        gc_store = PdfStore(
+            database,
+            storage_root,
+            user_quota_bytes=int(os.getenv("STORAGE_USER_QUOTA_BYTES", 0)),
+            global_quota_bytes=int(os.getenv("STORAGE_GLOBAL_QUOTA_BYTES", 0)),
+            archive_after_days=float(os.getenv("STORAGE_ARCHIVE_AFTER_DAYS", 30)),
+        )
+        asyncio.run(gc_store.collect())
+        print(gc_store.snapshot())
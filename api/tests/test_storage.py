@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from history import LESSONS_COLLECTION
+from storage import OBJECT_ARCHIVED, OBJECT_HOT, ORPHAN_GRACE, PdfStore
+
+
+LONG_AGO = datetime.now(timezone.utc) - timedelta(days=1)
+
+
+def new_store(root, **kwargs):
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    return db, PdfStore(db, str(root), gc_interval=0, **kwargs)
+
+
+async def put_lesson(db, store, telegram_id, lesson_id, data, created_at):
+    content_hash, storage_key = await store.put(telegram_id, data)
+    await db[LESSONS_COLLECTION].insert_one({
+        "_id": lesson_id,
+        "telegram_id": telegram_id,
+        "size": len(data),
+        "storage_key": storage_key,
+        "content_hash": content_hash,
+        "created_at": created_at,
+    })
+    return content_hash
+
+
+def test_collect_archives_unshared_lessons_until_user_is_under_quota(tmp_path):
+    async def run():
+        db, store = new_store(tmp_path, user_quota_bytes=200, archive_after_days=0)
+        shared = await put_lesson(db, store, 1, "a", b"a" * 100, LONG_AGO)
+        await put_lesson(db, store, 2, "b", b"a" * 100, LONG_AGO)
+        older = await put_lesson(db, store, 1, "c", b"c" * 100, LONG_AGO + timedelta(minutes=1))
+        newest = await put_lesson(db, store, 1, "d", b"d" * 100, LONG_AGO + timedelta(minutes=2))
+        await db["pdf_objects"].update_many({}, {"$set": {"last_access": LONG_AGO}})
+
+        await store.collect()
+        states = {doc["_id"]: doc["state"] async for doc in db["pdf_objects"].find()}
+        usage = await db["storage_usage"].find_one({"_id": 1})
+        return states[shared], states[older], states[newest], usage["bytes"], os.path.exists(store.archive_path(older))
+
+    assert asyncio.run(run()) == (OBJECT_HOT, OBJECT_ARCHIVED, OBJECT_HOT, 200, True)
+
+
+def test_released_object_is_removed_after_the_orphan_grace(tmp_path):
+    async def run():
+        db, store = new_store(tmp_path, archive_after_days=0)
+        content_hash, _ = await store.put(1, b"x" * 100)
+        await store.put(2, b"x" * 100)
+        path = store.object_path(content_hash)
+
+        await store.release(1, content_hash, 100)
+        await db["pdf_objects"].update_one({"_id": content_hash}, {"$set": {"last_access": LONG_AGO - ORPHAN_GRACE}})
+        await store.collect()
+        kept = os.path.exists(path) and await db["pdf_objects"].find_one({"_id": content_hash}) is not None
+
+        await store.release(2, content_hash, 100)
+        await store.collect()
+        removed = not os.path.exists(path) and await db["pdf_objects"].find_one({"_id": content_hash}) is None
+        usage = {doc["_id"]: doc["bytes"] async for doc in db["storage_usage"].find()}
+        return kept, removed, usage, store.stats["orphans_removed"]
+
+    assert asyncio.run(run()) == (True, True, {"global": 0, 1: 0, 2: 0}, 1)
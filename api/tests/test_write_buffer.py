@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from users_repo import MotorUserRepository
+from write_buffer import UserWriteBuffer
+
+
+class SlowRepository(MotorUserRepository):
+    # mongomock's bulk_write lags behind pymongo, so apply the batch one document at a time.
+    async def bulk_update(self, updates):
+        await asyncio.sleep(0.05)
+        for telegram_id, update_data in updates:
+            await self.users.update_one({"_id": telegram_id}, update_data)
+
+
+def test_conflicting_update_merges_into_entry_queued_during_flush():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        await db["users"].insert_one({"_id": 1, "a": 0})
+        buffer = UserWriteBuffer(SlowRepository(db), flush_interval=0.01, max_batch=100)
+        await buffer.start()
+        try:
+            await buffer.update(1, {"$set": {"a": 1}}, wait=False)
+            # Conflicts with the pending $set, so it flushes; the next update queues a new entry meanwhile.
+            unset = asyncio.create_task(buffer.update(1, {"$unset": {"a": ""}}))
+            await asyncio.sleep(0)
+            await asyncio.wait_for(asyncio.gather(unset, buffer.update(1, {"$set": {"b": 2}})), timeout=5)
+        finally:
+            await buffer.close()
+        return await db["users"].find_one({"_id": 1})
+
+    assert asyncio.run(run()) == {"_id": 1, "b": 2}
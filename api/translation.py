@@ -0,0 +1,49 @@
+from fanout import run_sections
+from lessons import (
+    build_translation_prompt,
+    clean_translation_html,
+    markup_signature,
+    split_lesson_html,
+)
+from metrics import stage
+
+
+class LessonTranslator:
+    def __init__(self, complete, max_concurrency=6, section_attempts=2):
+        self.complete = complete
+        self.max_concurrency = max(1, max_concurrency)
+        self.section_attempts = max(1, section_attempts)
+        self.stats = {"lessons": 0, "sections": 0, "section_retries": 0, "section_failures": 0, "markup_mismatches": 0}
+
+    def fan_out(self, lesson_html):
+        return min(self.max_concurrency, len(split_lesson_html(lesson_html)))
+
+    async def translate(self, lesson_html, source_language, lesson_language, on_progress=None):
+        parts = split_lesson_html(lesson_html)
+        used = []
+
+        async def translate_part(index):
+            fragment = parts[index]
+            if not fragment.strip():
+                return fragment
+            with stage("lesson_translation"):
+                text, tokens = await self.complete(build_translation_prompt(fragment.strip(), source_language, lesson_language))
+            used.append(tokens)
+            body = clean_translation_html(text)
+            if markup_signature(body) != markup_signature(fragment):
+                self.stats["markup_mismatches"] += 1
+                raise ValueError("translation changed the lesson markup")
+            return body + "\n"
+
+        async def report(index=None, done=0):
+            if on_progress is not None:
+                await on_progress({"stage": "translating", "sections_done": done, "sections_total": len(parts)})
+
+        await report()
+        translated = await run_sections(range(len(parts)), translate_part, self.max_concurrency, self.section_attempts, self.stats, report)
+
+        self.stats["lessons"] += 1
+        return "".join(translated[index] for index in range(len(parts))), sum(used)
+
+    def snapshot(self):
+        return {**self.stats, "max_concurrency": self.max_concurrency}
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import urllib.parse
+import httpx
+
+from fastapi import HTTPException
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+
+from resilience import Dependency
+
+
+USERS_COLLECTION = "users"
+
+PROFILE_PROJECTION = {
+    "username": 1,
+    "first_name": 1,
+    "last_name": 1,
+    "language_code": 1,
+    "last_request": 1,
+}
+LESSON_REQUEST_PROJECTION = {"language_code": 1, "last_request": 1}
+EXISTS_PROJECTION = {"_id": 1}
+IDEMPOTENT_OPERATORS = {"$set", "$unset", "$setOnInsert"}
+
+
+class MotorUserRepository:
+    def __init__(self, db):
+        self.users = db[USERS_COLLECTION]
+
+    async def ensure_indexes(self):
+        await self.users.create_index([("username", ASCENDING)], name="username", sparse=True)
+
+    async def get(self, telegram_id, projection=None):
+        try:
+            return await self.users.find_one({"_id": telegram_id}, projection)
+        except PyMongoError as e:
+            print(f"Database error: {e}")
+            raise HTTPException(status_code=500, detail="Database error.")
+
+    async def update(self, telegram_id, update_data, upsert=False, projection=None):
+        try:
+            return await self.users.find_one_and_update(
+                {"_id": telegram_id},
+                update_data,
+                projection=projection or EXISTS_PROJECTION,
+                upsert=upsert,
+                return_document=ReturnDocument.AFTER,
+            )
+        except PyMongoError as e:
+            print(f"Database error: {e}")
+            raise HTTPException(status_code=500, detail="Database error.")
+
+    async def bulk_update(self, updates):
+        try:
+            await self.users.bulk_write(
+                [UpdateOne({"_id": telegram_id}, update_data) for telegram_id, update_data in updates],
+                ordered=False,
+            )
+        except PyMongoError as e:
+            print(f"Database error: {e}")
+            raise HTTPException(status_code=500, detail="Database error.")
+
+    async def create_if_missing(self, telegram_id, user_data):
+        return await self.update(telegram_id, {"$setOnInsert": user_data}, upsert=True)
+
+    async def close(self):
+        pass
+
+
+class HttpProxyUserRepository:
+    def __init__(self, api_url, mongo_url, db_name, dependency):
+        self.api_url = api_url
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        self.dependency = dependency
+        self.client = httpx.AsyncClient(
+            timeout=10.0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+
+    async def ensure_indexes(self):
+        pass
+
+    async def _send(self, method, url, idempotent=True, **kwargs):
+        async def attempt():
+            response = await self.client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response.json()
+
+        try:
+            return await self.dependency.call(attempt, idempotent=idempotent)
+        except httpx.HTTPError as e:
+            print(f"Fetch error: {e}")
+            raise HTTPException(status_code=502, detail="Fetch error.")
+
+    async def get(self, telegram_id, projection=None):
+        filter_json_str = json.dumps({"_id": telegram_id})
+        params = {
+            "mongo_url": self.mongo_url,
+            "db_name": self.db_name,
+            "collection_name": USERS_COLLECTION,
+            "filter_json": filter_json_str,
+            "limit": 1,
+            "skip": 0,
+        }
+        payload = await self._send("GET", f"{self.api_url}?{urllib.parse.urlencode(params)}")
+
+        user = payload["data"][0] if payload["count"] > 0 else None
+        if user is None or not projection:
+            return user
+        return {k: v for k, v in user.items() if k == "_id" or projection.get(k)}
+
+    async def update(self, telegram_id, update_data, upsert=False, projection=None):
+        payload = {
+            "db_name": self.db_name,
+            "collection_name": USERS_COLLECTION,
+            "filter": {"_id": telegram_id},
+            "update": update_data,
+            "mongo_url": self.mongo_url
+        }
+        if upsert:
+            payload["upsert"] = True
+        idempotent = set(update_data) <= IDEMPOTENT_OPERATORS
+        await self._send("PATCH", self.api_url, idempotent=idempotent, json=payload)
+        return None
+
+    async def bulk_update(self, updates):
+        await asyncio.gather(*(self.update(telegram_id, update_data) for telegram_id, update_data in updates))
+
+    async def create_if_missing(self, telegram_id, user_data):
+        if await self.get(telegram_id, EXISTS_PROJECTION):
+            return None
+
+        data = dict(user_data)
+        data["_id"] = telegram_id
+        await self._send("POST", self.api_url, idempotent=False, json={
+            "db_name": self.db_name,
+            "collection_name": USERS_COLLECTION,
+            "data": data,
+            "mongo_url": self.mongo_url
+        })
+        return None
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_user_repository(backend, db, api_url, mongo_url, db_name, dependency=None):
+    if backend == "motor":
+        return MotorUserRepository(db)
+    if backend == "proxy":
+        return HttpProxyUserRepository(api_url, mongo_url, db_name, dependency or Dependency("mongo_proxy"))
+    raise ValueError(f"Unknown USER_BACKEND: {backend!r} (expected 'motor' or 'proxy')")
@@ -0,0 +1,86 @@
+import asyncio
+import importlib
+import sys
+import time
+
+from metrics import STARTUP_SECONDS
+
+
+class StartupState:
+    def __init__(self, phase_timeout=60, retry_interval=5):
+        self.phase_timeout = phase_timeout
+        self.retry_interval = retry_interval
+        self.ready = False
+        self.draining = False
+        self.phases = {}
+        self.imports = {}
+        self.errors = {}
+        self.task = None
+
+    def record(self, phase, seconds):
+        self.phases[phase] = round(seconds, 4)
+        STARTUP_SECONDS.set(seconds, phase)
+
+    def import_module(self, name):
+        if name in sys.modules:
+            return sys.modules[name]
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        self.imports[name] = round(time.perf_counter() - started, 4)
+        return module
+
+    async def _run_phase(self, name, phase):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(phase(), timeout=self.phase_timeout)
+        except Exception as e:
+            self.errors[name] = str(e) or type(e).__name__
+            print(f"Warmup phase {name} failed: {self.errors[name]}")
+            return False
+        finally:
+            self.record(name, time.perf_counter() - started)
+        self.errors.pop(name, None)
+        return True
+
+    async def _run_phases(self, phases):
+        results = await asyncio.gather(*(self._run_phase(name, phase) for name, phase in phases.items()))
+        return {name: phase for (name, phase), ok in zip(phases.items(), results) if not ok}
+
+    async def warm_up(self, phases):
+        started = time.perf_counter()
+        failed = await self._run_phases(phases)
+        self.record("warmup", time.perf_counter() - started)
+        self.ready = not failed
+        if failed:
+            self.task = asyncio.create_task(self._retry(failed))
+
+    async def _retry(self, failed):
+        while failed:
+            await asyncio.sleep(self.retry_interval)
+            failed = await self._run_phases(failed)
+        self.ready = not self.draining
+        print("Warmup recovered, worker is ready")
+
+    def report(self):
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        print(f"Startup: {phases}; {'ready' if self.ready else 'not ready'}")
+        if self.imports:
+            imports = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(self.imports.items(), key=lambda item: -item[1]))
+            print(f"Deferred imports: {imports}")
+
+    async def drain(self):
+        self.draining = True
+        self.ready = False
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def snapshot(self):
+        return {
+            "ready": self.ready,
+            "draining": self.draining,
+            "phases": self.phases,
+            "imports": self.imports,
+            "errors": self.errors,
+        }
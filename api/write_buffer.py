@@ -0,0 +1,150 @@
+import asyncio
+
+
+MERGEABLE_OPERATORS = ("$set", "$unset", "$inc", "$push", "$setOnInsert")
+
+
+def _paths_overlap(a, b):
+    return a == b or a.startswith(b + ".") or b.startswith(a + ".")
+
+
+def _push_items(value):
+    if isinstance(value, dict):
+        if set(value) != {"$each"}:
+            return None
+        return list(value["$each"])
+    return [value]
+
+
+def merge_updates(current, new):
+    merged = {op: dict(fields) for op, fields in current.items()}
+    touched = [(field, op) for op, fields in current.items() for field in fields]
+
+    for op, fields in new.items():
+        if op not in MERGEABLE_OPERATORS:
+            return None
+        target = merged.setdefault(op, {})
+        for field, value in fields.items():
+            for other_field, other_op in touched:
+                if other_field == field and other_op == op:
+                    continue
+                if _paths_overlap(field, other_field):
+                    return None
+
+            if field in target and op == "$inc":
+                target[field] += value
+            elif field in target and op == "$push":
+                existing_items = _push_items(target[field])
+                new_items = _push_items(value)
+                if existing_items is None or new_items is None:
+                    return None
+                target[field] = {"$each": existing_items + new_items}
+            else:
+                target[field] = value
+            touched.append((field, op))
+
+    return merged
+
+
+class PendingUserUpdate:
+    __slots__ = ("update", "futures")
+
+    def __init__(self, update):
+        self.update = update
+        self.futures = []
+
+
+class UserWriteBuffer:
+    def __init__(self, repo, flush_interval, max_batch):
+        self.repo = repo
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending = {}
+        self.flush_lock = asyncio.Lock()
+        self.kick = asyncio.Event()
+        self.task = None
+        self.stats = {"updates": 0, "merged": 0, "conflicts": 0, "flushes": 0, "documents_written": 0, "errors": 0}
+
+    def has_pending(self, telegram_id):
+        return telegram_id in self.pending
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    async def update(self, telegram_id, update_data, flush=False, wait=True):
+        self.stats["updates"] += 1
+        while True:
+            pending = self.pending.get(telegram_id)
+            if pending is None:
+                pending = PendingUserUpdate(merge_updates({}, update_data) or update_data)
+                self.pending[telegram_id] = pending
+                break
+
+            merged = merge_updates(pending.update, update_data)
+            if merged is not None:
+                self.stats["merged"] += 1
+                pending.update = merged
+                break
+
+            # Another update may have queued a fresh entry while we flushed; look again.
+            self.stats["conflicts"] += 1
+            await self.flush([telegram_id])
+
+        future = None
+        if wait or flush:
+            future = asyncio.get_running_loop().create_future()
+            pending.futures.append(future)
+
+        if flush:
+            await self.flush([telegram_id])
+        elif len(self.pending) >= self.max_batch:
+            self.kick.set()
+
+        if future is not None:
+            await future
+
+    async def flush(self, telegram_ids=None):
+        async with self.flush_lock:
+            ids = list(self.pending) if telegram_ids is None else [i for i in telegram_ids if i in self.pending]
+            if not ids:
+                return
+            batch = [(telegram_id, self.pending.pop(telegram_id)) for telegram_id in ids]
+
+            self.stats["flushes"] += 1
+            try:
+                await self.repo.bulk_update([(telegram_id, pending.update) for telegram_id, pending in batch])
+            except Exception as e:
+                self.stats["errors"] += 1
+                for _, pending in batch:
+                    for future in pending.futures:
+                        if not future.done():
+                            future.set_exception(e)
+                if not any(pending.futures for _, pending in batch):
+                    print(f"Write buffer flush error: {e}")
+                return
+
+            self.stats["documents_written"] += len(batch)
+            for _, pending in batch:
+                for future in pending.futures:
+                    if not future.done():
+                        future.set_result(None)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.kick.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.kick.clear()
+            if self.pending:
+                await self.flush()
+
+    def snapshot(self):
+        return {**self.stats, "pending_users": len(self.pending)}
@@ -0,0 +1,226 @@
+import asyncio
+import itertools
+import json
+import time
+
+from types import SimpleNamespace
+from aiohttp import web
+
+
+LESSON_SECTION_TITLES = (
+    "Introduction",
+    "Key concepts",
+    "Examples",
+    "Exercises",
+    "Summary",
+    "Self-check",
+)
+
+TRANSLATION_MARKER = "Reply with the translated HTML only."
+
+
+def fake_lesson_html(topic, size):
+    paragraph_count = max(1, size // (len(LESSON_SECTION_TITLES) * 120))
+    paragraph = f"<p>{topic}: " + "lorem ipsum dolor sit amet " * 4 + "</p>\n"
+    sections = [
+        f"<h2>{title}</h2>\n" + paragraph * paragraph_count
+        for title in LESSON_SECTION_TITLES
+    ]
+    return f"<h1>{topic}</h1>\n" + "".join(sections)
+
+
+class FakeGeminiModels:
+    def __init__(self, latency, html_size, stream_chunks):
+        self.latency = latency
+        self.html_size = html_size
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+
+    def _usage(self, prompt, html):
+        prompt_tokens = len(prompt) // 4
+        output_tokens = len(html) // 4
+        return SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+
+    async def generate_content(self, model, contents, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if TRANSLATION_MARKER in contents:
+            html = contents.split(TRANSLATION_MARKER, 1)[1].strip()
+            return SimpleNamespace(text=html, usage_metadata=self._usage(contents, html))
+        html = fake_lesson_html("Benchmark lesson", self.html_size)
+        return SimpleNamespace(text=html, usage_metadata=self._usage(contents, html))
+
+    async def generate_content_stream(self, model, contents, **kwargs):
+        self.calls += 1
+        html = fake_lesson_html("Benchmark lesson", self.html_size)
+        chunk_size = max(1, len(html) // self.stream_chunks)
+        chunks = [html[i:i + chunk_size] for i in range(0, len(html), chunk_size)]
+        usage = self._usage(contents, html)
+
+        async def stream():
+            for index, chunk in enumerate(chunks):
+                await asyncio.sleep(self.latency / len(chunks))
+                last = index == len(chunks) - 1
+                yield SimpleNamespace(text=chunk, usage_metadata=usage if last else None)
+
+        return stream()
+
+
+class FakeGeminiClient:
+    def __init__(self, latency=2.0, html_size=20000, stream_chunks=20):
+        self.models = FakeGeminiModels(latency, html_size, stream_chunks)
+        self.aio = SimpleNamespace(models=self.models)
+
+
+class FakePdfRenderer:
+    def __init__(self, latency=0.5, pdf_size=200000):
+        self.latency = latency
+        self.pdf_size = pdf_size
+        self.rendered = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def render_pdf(self, html):
+        await asyncio.sleep(self.latency)
+        self.rendered += 1
+        return b"%PDF-1.7\n" + b"0" * self.pdf_size
+
+    def snapshot(self):
+        return {"rendered": self.rendered}
+
+
+def _apply_update(doc, update, inserting):
+    for field, value in update.get("$set", {}).items():
+        doc[field] = value
+    for field in update.get("$unset", {}):
+        doc.pop(field, None)
+    for field, value in update.get("$inc", {}).items():
+        doc[field] = doc.get(field, 0) + value
+    for field, value in update.get("$push", {}).items():
+        items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+        doc.setdefault(field, []).extend(items)
+    if inserting:
+        for field, value in update.get("$setOnInsert", {}).items():
+            doc[field] = value
+
+
+class FakeMongoProxy:
+    def __init__(self, latency=0.005):
+        self.latency = latency
+        self.collections = {}
+        self.requests = 0
+
+    def _collection(self, db_name, collection_name):
+        return self.collections.setdefault((db_name, collection_name), {})
+
+    async def find(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        params = request.query
+        collection = self._collection(params["db_name"], params["collection_name"])
+        query = json.loads(params.get("filter_json", "{}"))
+        if "_id" in query:
+            doc = collection.get(query["_id"])
+            docs = [doc] if doc is not None else []
+        else:
+            docs = [doc for doc in collection.values() if all(doc.get(k) == v for k, v in query.items())]
+        skip = int(params.get("skip", 0))
+        limit = int(params.get("limit", 0)) or len(docs)
+        docs = docs[skip:skip + limit]
+        return web.json_response({"data": docs, "count": len(docs)})
+
+    async def insert(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        body = await request.json()
+        collection = self._collection(body["db_name"], body["collection_name"])
+        doc = body["data"]
+        if doc["_id"] in collection:
+            return web.json_response({"detail": "Duplicate key"}, status=409)
+        collection[doc["_id"]] = doc
+        return web.json_response({"inserted_id": doc["_id"]})
+
+    async def update(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        body = await request.json()
+        collection = self._collection(body["db_name"], body["collection_name"])
+        doc_id = body["filter"]["_id"]
+        doc = collection.get(doc_id)
+        inserting = doc is None
+        if inserting:
+            if not body.get("upsert"):
+                return web.json_response({"matched_count": 0, "modified_count": 0})
+            doc = collection[doc_id] = {"_id": doc_id}
+        _apply_update(doc, body["update"], inserting)
+        return web.json_response({"matched_count": 0 if inserting else 1, "modified_count": 1})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/", self.find)
+        app.router.add_post("/", self.insert)
+        app.router.add_patch("/", self.update)
+        return app
+
+
+class FakeTelegram:
+    def __init__(self, latency=0.03):
+        self.latency = latency
+        self.message_ids = itertools.count(1)
+        self.file_ids = itertools.count(1)
+        self.calls = {}
+
+    def _message(self, chat_id, **extra):
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            **extra,
+        }
+
+    def _document_message(self, chat_id):
+        file_number = next(self.file_ids)
+        return self._message(
+            chat_id,
+            document={"file_id": f"bench-file-{file_number}", "file_unique_id": f"bench-{file_number}"},
+        )
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        form = await request.post()
+        await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Studiora bench"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(form.get("chat_id", 0), text=form.get("text", ""))
+        elif method == "sendDocument":
+            result = self._document_message(form.get("chat_id", 0))
+        elif method == "sendMediaGroup":
+            result = [self._document_message(form.get("chat_id", 0)) for _ in json.loads(form.get("media", "[]"))]
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+async def serve(app, host="127.0.0.1", port=0):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timezone
+
+from fakes import FakeGeminiClient, FakeMongoProxy, FakePdfRenderer, FakeTelegram, serve
+
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+API_DIR = os.path.join(ROOT_DIR, "api")
+BOT_DIR = os.path.join(ROOT_DIR, "bot")
+SCENARIOS = ("profile_lookup", "history_paging", "lesson_generation", "language_switch")
+LANGUAGES = ("en", "ru", "hy")
+LEVELS = ("A1", "A2", "B1", "B2", "C1", "C2")
+USER_ID_BASE = 700000000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Studiora end-to-end benchmark")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=500, help="operations per scenario")
+    parser.add_argument("--generation-requests", type=int, default=50, help="operations for lesson_generation")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--lessons-per-user", type=int, default=20)
+    parser.add_argument("--distinct-topics", type=int, default=10)
+    parser.add_argument("--gemini-latency", type=float, default=2.0)
+    parser.add_argument("--gemini-html-size", type=int, default=20000)
+    parser.add_argument("--gemini-stream-chunks", type=int, default=20)
+    parser.add_argument("--generation-mode", choices=("monolithic", "parallel"), default="monolithic")
+    parser.add_argument("--proxy-latency", type=float, default=0.005)
+    parser.add_argument("--telegram-latency", type=float, default=0.03)
+    parser.add_argument("--fake-pdf", action="store_true", help="replace WeasyPrint with a fixed-size fake renderer")
+    parser.add_argument("--pdf-latency", type=float, default=0.5)
+    parser.add_argument("--pdf-size", type=int, default=200000)
+    parser.add_argument("--mongo", default=os.getenv("MONGO_DB", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="studiora_bench")
+    parser.add_argument("--keep-db", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else None,
+        "mean": sum(values) / len(values) if values else None,
+    }
+
+
+class LoopLagMonitor:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self.task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self.samples = []
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        return summarize(self.samples)
+
+
+async def run_scenario(name, operation, total, concurrency):
+    latencies = []
+    errors = {}
+    counter = iter(range(total))
+    peak_rss = rss_bytes()
+
+    async def worker():
+        nonlocal peak_rss
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                await operation(index)
+            except Exception as e:
+                key = type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if index % 50 == 0:
+                peak_rss = max(peak_rss, rss_bytes())
+
+    monitor = LoopLagMonitor()
+    rss_before = rss_bytes()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    loop_lag = await monitor.stop()
+    rss_after = rss_bytes()
+
+    result = {
+        "operations": total,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": len(latencies) / elapsed if elapsed else None,
+        "latency_seconds": summarize(latencies),
+        "event_loop_lag_seconds": loop_lag,
+        "rss_bytes": {"before": rss_before, "after": rss_after, "peak": max(peak_rss, rss_after)},
+    }
+    print(
+        f"{name}: {result['throughput_per_second'] or 0:.1f} op/s, "
+        f"p50 {result['latency_seconds']['p50'] or 0:.4f}s, "
+        f"p99 {result['latency_seconds']['p99'] or 0:.4f}s, "
+        f"errors {sum(errors.values())}"
+    )
+    return result
+
+
+def callback_update(update_id, user_id, data):
+    user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "language_code": "en"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Studiora"},
+                "text": "bench",
+            },
+        },
+    }
+
+
+async def main():
+    args = parse_args()
+    random.seed(args.seed)
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    output_path = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix="studiora-bench-")
+    shutil.copy(os.path.join(BOT_DIR, "Studiora.translations.json"), workdir)
+    os.chdir(workdir)
+
+    mongo_proxy = FakeMongoProxy(args.proxy_latency)
+    telegram = FakeTelegram(args.telegram_latency)
+    proxy_runner, proxy_url = await serve(mongo_proxy.app())
+    telegram_runner, telegram_url = await serve(telegram.app())
+    api_port = free_port()
+    api_url = f"http://127.0.0.1:{api_port}"
+
+    os.environ.update({
+        "MONGO_DB": args.mongo,
+        "MONGO_DB_NAME": args.db_name,
+        "USER_BACKEND": "proxy",
+        "MONGO_API_URL": f"{proxy_url}/",
+        "MONGO_URL": "mongodb://bench",
+        "GEMINI_API_KEY": "bench",
+        "BOT_TOKEN": "123456:bench",
+        "API_URL": api_url,
+        "BOT_CALLBACK_PORT": "",
+        "BOT_CALLBACK_URL": "",
+        "BOT_INTERNAL_URL": "",
+        "FILE_ID_CACHE_PATH": os.path.join(workdir, "file_ids.sqlite3"),
+    })
+    sys.path[:0] = [API_DIR, BOT_DIR]
+
+    import uvicorn
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    import main as api_main
+    import bot as bot_module
+
+    gemini = FakeGeminiClient(args.gemini_latency, args.gemini_html_size, args.gemini_stream_chunks)
+    api_main.gemini_client = gemini
+    if args.fake_pdf:
+        api_main.pdf_renderer = FakePdfRenderer(args.pdf_latency, args.pdf_size)
+
+    server = uvicorn.Server(uvicorn.Config(api_main.app, host="127.0.0.1", port=api_port, log_level="warning", lifespan="on"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            await server_task
+            raise SystemExit("API server failed to start")
+        await asyncio.sleep(0.05)
+
+    bot = Bot(token="123456:bench", session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_url)))
+    bot_module.bot = bot
+    bot_module.dp.update.outer_middleware.register(bot_module.set_user_language_middleware)
+    await bot_module.dp.emit_startup(bot=bot)
+
+    import httpx
+
+    client = httpx.AsyncClient(base_url=api_url, timeout=120.0, limits=httpx.Limits(max_connections=args.concurrency * 2))
+    user_ids = [USER_ID_BASE + i for i in range(args.users)]
+    topics = [f"Benchmark topic {i}" for i in range(args.distinct_topics)]
+    update_ids = iter(range(1, 10 ** 9))
+    results = {}
+
+    try:
+        print(f"Seeding {args.users} users")
+        for user_id in user_ids:
+            response = await client.post("/users", json={
+                "telegram_id": user_id,
+                "username": f"bench{user_id}",
+                "first_name": "Bench",
+                "last_name": str(user_id),
+                "language_code": random.choice(LANGUAGES),
+            })
+            response.raise_for_status()
+
+        if "history_paging" in scenarios:
+            print(f"Seeding {args.lessons_per_user} lessons per user")
+            for user_id in user_ids:
+                for n in range(args.lessons_per_user):
+                    await api_main.lesson_history.record(
+                        f"{user_id}-{n:06d}",
+                        user_id,
+                        f"benchmark_{user_id}_{n}.pdf",
+                        {"topic": random.choice(topics), "current_level": "A1", "target_level": "B1", "language_code": "en"},
+                        size=args.pdf_size,
+                        storage_key=f"{user_id}/benchmark_{user_id}_{n}.pdf",
+                    )
+                await api_main.users_repo.update(user_id, {"$set": {"lesson_count": args.lessons_per_user}})
+
+        async def profile_lookup(index):
+            response = await client.get(f"/users/{random.choice(user_ids)}")
+            response.raise_for_status()
+
+        async def history_paging(index):
+            user_id = random.choice(user_ids)
+            response = await client.get(f"/users/{user_id}/history", params={"limit": 5})
+            response.raise_for_status()
+            cursor = response.json().get("next_cursor")
+            if cursor:
+                response = await client.get(f"/users/{user_id}/history", params={"limit": 5, "cursor": cursor})
+                response.raise_for_status()
+
+        async def lesson_generation(index):
+            user_id = user_ids[index % len(user_ids)]
+            response = await client.post(f"/users/{user_id}/last_request", json={
+                "topic": random.choice(topics),
+                "current_level": random.choice(LEVELS[:3]),
+                "target_level": random.choice(LEVELS[3:]),
+            })
+            response.raise_for_status()
+            response = await client.get(f"/users/{user_id}/lesson_details", params={"generation_mode": args.generation_mode})
+            response.raise_for_status()
+
+        async def language_switch(index):
+            user_id = random.choice(user_ids)
+            update = Update.model_validate(
+                callback_update(next(update_ids), user_id, f"set_lang:{random.choice(LANGUAGES)}"),
+                context={"bot": bot},
+            )
+            await bot_module.dp.feed_update(bot, update)
+
+        operations = {
+            "profile_lookup": (profile_lookup, args.requests),
+            "history_paging": (history_paging, args.requests),
+            "lesson_generation": (lesson_generation, args.generation_requests),
+            "language_switch": (language_switch, args.requests),
+        }
+        for name in scenarios:
+            operation, total = operations[name]
+            results[name] = await run_scenario(name, operation, total, min(args.concurrency, len(user_ids)))
+    finally:
+        await client.aclose()
+        await bot_module.dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        server.should_exit = True
+        await server_task
+        if not args.keep_db:
+            await api_main.mongo_client.drop_database(args.db_name)
+        await proxy_runner.cleanup()
+        await telegram_runner.cleanup()
+        os.chdir(ROOT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "backends": {
+            "gemini_calls": gemini.models.calls,
+            "mongo_proxy_requests": mongo_proxy.requests,
+            "telegram_calls": telegram.calls,
+        },
+        "scenarios": results,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
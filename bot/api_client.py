@@ -0,0 +1,121 @@
+import importlib.util
+import httpx
+
+from request_ids import API_EVENT_HOOKS, log
+
+
+DEFAULT_TIMEOUTS = {
+    "profile": 5.0,
+    "write": 10.0,
+    "history": 10.0,
+    "lesson_job": 30.0,
+}
+
+
+class StudioraApi:
+    def __init__(
+        self,
+        base_url: str,
+        timeouts: dict[str, float] | None = None,
+        connect_timeout: float = 3.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_retries: int = 2,
+        http2: bool = False,
+    ):
+        self.base_url = base_url.rstrip("/") if base_url else base_url
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.connect_timeout = connect_timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.connect_retries = connect_retries
+        self.http2 = http2
+        self.client: httpx.AsyncClient | None = None
+
+    async def start(self):
+        if self.client is not None:
+            return
+        http2 = self.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            log("API_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            transport=httpx.AsyncHTTPTransport(http2=http2, limits=self.limits, retries=self.connect_retries),
+            timeout=httpx.Timeout(self.timeouts["write"], connect=self.connect_timeout),
+            event_hooks=API_EVENT_HOOKS,
+        )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def _timeout(self, endpoint: str) -> httpx.Timeout:
+        return httpx.Timeout(self.timeouts[endpoint], connect=self.connect_timeout)
+
+    async def _request(self, method: str, path: str, endpoint: str, **kwargs) -> httpx.Response:
+        if self.client is None:
+            raise RuntimeError("StudioraApi.start() has not been called")
+        return await self.client.request(
+            method,
+            path,
+            timeout=self._timeout(endpoint),
+            headers={"X-Request-Timeout": str(self.timeouts[endpoint])},
+            **kwargs,
+        )
+
+    async def get_user(self, user_id: int) -> dict | None:
+        response = await self._request("GET", f"/users/{user_id}", "profile")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    async def create_user(self, user: dict) -> None:
+        response = await self._request("POST", "/users", "write", json=user)
+        response.raise_for_status()
+
+    async def set_language(self, user_id: int, lang_code: str) -> None:
+        response = await self._request("PATCH", f"/users/{user_id}/language", "write", json={"language_code": lang_code})
+        response.raise_for_status()
+
+    async def save_last_request(self, user_id: int, lesson_request: dict) -> dict | None:
+        response = await self._request("POST", f"/users/{user_id}/last_request", "write", json=lesson_request)
+        response.raise_for_status()
+        return response.json().get("last_request")
+
+    async def clear_last_request(self, user_id: int) -> None:
+        await self.save_last_request(user_id, {})
+
+    async def create_lesson_job(self, user_id: int) -> dict:
+        response = await self._request("POST", "/lessons/jobs", "lesson_job", json={"telegram_id": user_id})
+        response.raise_for_status()
+        return response.json()
+
+    async def get_lesson_job(self, job_id: str) -> dict:
+        response = await self._request("GET", f"/lessons/jobs/{job_id}", "profile")
+        response.raise_for_status()
+        return response.json()
+
+    async def claim_lesson_delivery(self, job_id: str) -> dict | None:
+        response = await self._request("POST", f"/lessons/jobs/{job_id}/delivery", "write")
+        if response.status_code == 409:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    async def get_history(self, user_id: int, limit: int, cursor: str | None = None) -> dict:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = await self._request("GET", f"/users/{user_id}/history", "history", params=params)
+        response.raise_for_status()
+        return response.json()
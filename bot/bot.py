@@ -1,69 +1,191 @@
 import os
 import asyncio
-import httpx
-import json
+import contextvars
+import hmac
+import signal
 
+import aiohttp
+from aiohttp import web
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import CommandStart, Command
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, TelegramObject, Update
+from aiogram.filters import CommandStart, Command, Filter
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, TelegramObject, Update
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.exceptions import TelegramBadRequest
 from dotenv import load_dotenv
 from typing import Callable, Dict, Any, Awaitable
-from io import BytesIO
+from lesson_jobs import LessonJobWaiter
+from file_ids import FileIdCache, SqliteFileIds
+from profile_cache import ProfileCache
+from state_backend import create_state_backend
+from partitions import run_ingest, run_partition_workers, partition_for, update_user_id
+from update_pipeline import UpdatePipeline
+from i18n import CatalogStore
+from telegram_io import TelegramIO
+from api_client import StudioraApi
+from request_ids import current_request_id, new_request_id, request_headers, log
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 API_URL = os.getenv("API_URL")
+BOT_CALLBACK_HOST = os.getenv("BOT_CALLBACK_HOST", "0.0.0.0")
+BOT_CALLBACK_PORT = os.getenv("BOT_CALLBACK_PORT")
+BOT_CALLBACK_SECRET = os.getenv("BOT_CALLBACK_SECRET")
+LESSON_JOB_TIMEOUT = float(os.getenv("LESSON_JOB_TIMEOUT", 180))
+LESSON_JOB_LATE_TIMEOUT = float(os.getenv("LESSON_JOB_LATE_TIMEOUT", 1800))
+FILE_ID_CACHE_PATH = os.getenv("FILE_ID_CACHE_PATH", "file_ids.sqlite3")
+FILE_ID_CACHE_MAX_ENTRIES = int(os.getenv("FILE_ID_CACHE_MAX_ENTRIES", 10000))
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", 10000))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", 600))
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL")
+BOT_ROLE = os.getenv("BOT_ROLE", "standalone")
+BOT_PARTITIONS = int(os.getenv("BOT_PARTITIONS", 1))
+BOT_WORKER_PARTITIONS = os.getenv("BOT_WORKER_PARTITIONS", "")
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+BOT_WEBHOOK_URL = os.getenv("BOT_WEBHOOK_URL")
+BOT_WEBHOOK_PATH = os.getenv("BOT_WEBHOOK_PATH", "/telegram/webhook")
+BOT_WEBHOOK_SECRET = os.getenv("BOT_WEBHOOK_SECRET")
+BOT_WEBHOOK_WORKERS = int(os.getenv("BOT_WEBHOOK_WORKERS", 32))
+BOT_WEBHOOK_QUEUE_SIZE = int(os.getenv("BOT_WEBHOOK_QUEUE_SIZE", 3200))
+BOT_WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("BOT_WEBHOOK_DRAIN_TIMEOUT", 30))
+TRANSLATIONS_RELOAD_INTERVAL = float(os.getenv("TRANSLATIONS_RELOAD_INTERVAL", 0))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", 5))
+TELEGRAM_MAX_FLOOD_WAIT = float(os.getenv("TELEGRAM_MAX_FLOOD_WAIT", 60))
+API_HTTP2 = os.getenv("API_HTTP2", "0") == "1"
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", 100))
+API_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("API_MAX_KEEPALIVE_CONNECTIONS", 20))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", 3))
+API_PROFILE_TIMEOUT = float(os.getenv("API_PROFILE_TIMEOUT", 5))
+API_WRITE_TIMEOUT = float(os.getenv("API_WRITE_TIMEOUT", 10))
+API_HISTORY_TIMEOUT = float(os.getenv("API_HISTORY_TIMEOUT", 10))
+API_LESSON_JOB_TIMEOUT = float(os.getenv("API_LESSON_JOB_TIMEOUT", 30))
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+telegram_io = TelegramIO(
+    bot,
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    chat_rate=TELEGRAM_CHAT_RATE,
+    chat_burst=TELEGRAM_CHAT_BURST,
+    max_flood_wait=TELEGRAM_MAX_FLOOD_WAIT,
+)
+state_backend = create_state_backend(STATE_BACKEND_URL)
+dp = Dispatcher(storage=state_backend.fsm_storage())
+api = StudioraApi(
+    API_URL,
+    timeouts={
+        "profile": API_PROFILE_TIMEOUT,
+        "write": API_WRITE_TIMEOUT,
+        "history": API_HISTORY_TIMEOUT,
+        "lesson_job": API_LESSON_JOB_TIMEOUT,
+    },
+    connect_timeout=API_CONNECT_TIMEOUT,
+    max_connections=API_MAX_CONNECTIONS,
+    max_keepalive_connections=API_MAX_KEEPALIVE_CONNECTIONS,
+    http2=API_HTTP2,
+)
+dp.startup.register(api.start)
+dp.shutdown.register(api.close)
 
 TRANSLATIONS_FILE = "Studiora.translations.json"
-translations_data = {}
-
-def load_translations(filepath):
-    global translations_data
-    with open(filepath, 'r', encoding='utf-8') as f:
-        translations_data = json.load(f)
+translations = CatalogStore(TRANSLATIONS_FILE)
         
 def get_translated_text(key, lang_code="en", **kwargs):
-    translation_dict = translations_data.get(key,{})
-    text = translation_dict.get(lang_code, translation_dict.get("en", ""))
-    return text.format(**kwargs)
-
-def is_button_text_for_key(message_text: str, key: str) -> bool:
-    translations_for_key = translations_data.get(key, {})
-    for translated_text in translations_for_key.values():
-        if translated_text == message_text:
-            return True
-    return False
-    
-load_translations(TRANSLATIONS_FILE)
-
-user_languages = {}
-user_messages_to_delete = {}
+    return translations.current.text(key, lang_code, **kwargs)
+
+class ButtonText(Filter):
+    def __init__(self, key: str):
+        self.key = key
+
+    async def __call__(self, message: types.Message) -> bool:
+        return message.text is not None and translations.current.key_for(message.text) == self.key
+
+current_user_language = contextvars.ContextVar("current_user_language", default=None)
+lesson_job_waiter = LessonJobWaiter()
+file_id_store = None if state_backend.shares_file_ids else SqliteFileIds(FILE_ID_CACHE_PATH)
+file_id_cache = FileIdCache(file_id_store or state_backend, FILE_ID_CACHE_MAX_ENTRIES)
+background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def send_cached_document(user_id: int, file_key: str, filename: str, url: str, caption: str | None = None):
+    file_id = await file_id_cache.get(user_id, file_key)
+    if file_id:
+        try:
+            return await telegram_io.send_document(user_id, file_id, caption)
+        except TelegramBadRequest as e:
+            log(f"Stale file_id for {file_key}, uploading again: {e}")
+            await file_id_cache.discard(user_id, file_key)
+
+    try:
+        msg = await telegram_io.send_document(
+            user_id,
+            types.URLInputFile(url, headers=request_headers(), filename=filename, timeout=60),
+            caption,
+        )
+    except aiohttp.ClientResponseError as e:
+        log(f"Could not fetch {file_key} from the API: {e}")
+        return None
+
+    await file_id_cache.set(user_id, file_key, msg.document.file_id)
+    return msg
+
+async def send_cached_documents(user_id: int, documents: list[tuple[str, str, str, str | None]]):
+    if len(documents) == 1:
+        msg = await send_cached_document(user_id, *documents[0])
+        return [msg] if msg is not None else []
+
+    media = []
+    for file_key, filename, url, caption in documents:
+        document = await file_id_cache.get(user_id, file_key) or types.URLInputFile(url, headers=request_headers(), filename=filename, timeout=60)
+        media.append(types.InputMediaDocument(media=document, caption=caption))
+
+    try:
+        messages = await telegram_io.send_media_group(user_id, media)
+    except (TelegramBadRequest, aiohttp.ClientResponseError) as e:
+        log(f"Could not send {len(documents)} documents as a media group, sending them one by one: {e}")
+        messages = [await send_cached_document(user_id, *document) for document in documents]
+        return [msg for msg in messages if msg is not None]
+
+    for (file_key, *_), msg in zip(documents, messages):
+        await file_id_cache.set(user_id, file_key, msg.document.file_id)
+    return messages
 
 async def delete_old_messages(user_id: int):
-    if user_id in user_messages_to_delete:
-        for msg_id in user_messages_to_delete[user_id]:
-            try:
-                await bot.delete_message(chat_id=user_id, message_id=msg_id)
-            except Exception as e:
-                pass 
-        user_messages_to_delete[user_id] = []
+    await telegram_io.delete_messages(user_id, await state_backend.pop_messages_to_delete(user_id))
 
 async def add_message_to_delete(user_id: int, message_id: int):
-    if user_id not in user_messages_to_delete:
-        user_messages_to_delete[user_id] = []
-    user_messages_to_delete[user_id].append(message_id)
+    await state_backend.add_message_to_delete(user_id, message_id)
+
+profile_cache = ProfileCache(api.get_user, PROFILE_CACHE_MAX_ENTRIES, PROFILE_CACHE_TTL)
+
+def get_user_language(user_id: int, default: str = 'en') -> str:
+    current = current_user_language.get()
+    if current is not None and current[0] == user_id:
+        lang_code = current[1]
+    else:
+        profile = profile_cache.peek(user_id)
+        lang_code = profile.get("language_code") if profile else None
+    return lang_code if lang_code in translations.current.languages else default
+
+async def resolve_user_language(user_id: int) -> str:
+    lang_code = await state_backend.get_language(user_id)
+    if lang_code in translations.current.languages:
+        return lang_code
+    return get_user_language(user_id)
 
 async def set_user_language_middleware(
     handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
     event: Update,
     data: Dict[str, Any]
 ) -> Any:
+    current_request_id.set(new_request_id())
     user = None
     if event.message:
         user = event.message.from_user
@@ -75,59 +197,37 @@ async def set_user_language_middleware(
     
     user_id = user.id
 
-    if user_id not in user_languages:
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(f"{API_URL}/users/{user_id}")
-                response.raise_for_status()
-                user_data_from_db = response.json()
-                
-                lang_code_to_set = user_data_from_db.get("language_code", 'en')
-
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    initial_telegram_lang_code = user.language_code if user.language_code else 'en'
-                    
-                    user_to_create = {
-                        "telegram_id": user_id,
-                        "username": user.username,
-                        "first_name": user.first_name,
-                        "last_name": user.last_name,
-                        "language_code": initial_telegram_lang_code
-                    }
-                    
-                    create_response = await client.post(f"{API_URL}/users", json=user_to_create)
-                    create_response.raise_for_status()
-                    lang_code_to_set = initial_telegram_lang_code
-                else:
-                    raise
-            except Exception as e:
-                raise
-            
-            if lang_code_to_set not in ['en', 'ru', 'hy']:
-                lang_code_to_set = 'en'
-            user_languages[user_id] = lang_code_to_set
-            
-    data["current_lang"] = user_languages.get(user_id, 'en')
+    lang_code = await state_backend.get_language(user_id)
+
+    if lang_code is None:
+        profile = await profile_cache.get(user_id)
+
+        if profile is None:
+            initial_telegram_lang_code = user.language_code if user.language_code else 'en'
+        
+            user_to_create = {
+                "telegram_id": user_id,
+                "username": user.username,
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "language_code": initial_telegram_lang_code
+            }
+        
+            await api.create_user(user_to_create)
+            profile_cache.put(user_id, {**user_to_create, "last_request": None})
+
+        profile = profile_cache.peek(user_id) or {}
+        lang_code = profile.get("language_code")
+        if lang_code not in translations.current.languages:
+            lang_code = 'en'
+        await state_backend.set_language(user_id, lang_code)
+
+    current_user_language.set((user_id, lang_code))
+    data["current_lang"] = lang_code
     return await handler(event, data)
 
 async def get_main_keyboard_markup(current_lang: str) -> ReplyKeyboardMarkup:
-    button_user_text = get_translated_text("btn_user",current_lang)
-    button_history_text = get_translated_text("btn_history", current_lang)
-    button_settings_text = get_translated_text("btn_settings", current_lang)
-    button_cl_text = get_translated_text("btn_create_lesson", current_lang)
-
-    keyboard_buttons = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=button_user_text), KeyboardButton(text=button_history_text)],
-            [KeyboardButton(text=button_settings_text),KeyboardButton(text=button_cl_text)],
-            [KeyboardButton(text="/help")]
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=False,
-        is_persistent=False
-    )
-    return keyboard_buttons
+    return translations.current.main_keyboard(current_lang)
 
 class CreateLessonStates(StatesGroup):
     waiting_for_lesson_details = State()
@@ -139,7 +239,7 @@ async def start_handler(message: types.Message, state: FSMContext):
     await delete_old_messages(message.from_user.id)
     await state.clear()
     user_id = message.from_user.id
-    current_lang = user_languages.get(user_id, 'en') 
+    current_lang = get_user_language(user_id, 'en') 
     
     start_message_text = get_translated_text("start_message", current_lang)
     
@@ -148,19 +248,7 @@ async def start_handler(message: types.Message, state: FSMContext):
 
     choose_language_text = get_translated_text("choose_language", current_lang)
 
-    button_en = InlineKeyboardButton(text="English",callback_data="set_lang:en") 
-    button_ru = InlineKeyboardButton(text="Русский",callback_data="set_lang:ru")
-    button_hy = InlineKeyboardButton(text="Հայերեն",callback_data="set_lang:hy")
-    
-    choose_language_markup = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                button_en,
-                button_ru,
-                button_hy
-            ]
-        ]
-    )
+    choose_language_markup = translations.current.language_markup
     
     msg = await message.answer(choose_language_text, reply_markup=choose_language_markup) 
     await add_message_to_delete(user_id, msg.message_id) 
@@ -168,18 +256,18 @@ async def start_handler(message: types.Message, state: FSMContext):
 @dp.message(Command(commands=["help"]))
 async def cmd_help(message: types.Message):
     await delete_old_messages(message.from_user.id) 
-    await message.answer(get_translated_text("cmd_help_description", user_languages.get(message.from_user.id, 'en')))
+    await message.answer(get_translated_text("cmd_help_description", get_user_language(message.from_user.id, 'en')))
 
 @dp.callback_query(lambda c: c.data and c.data.startswith('set_lang:'))
 async def set_language_callback(callback_query: types.CallbackQuery):
     user_id = callback_query.from_user.id
     new_lang = callback_query.data.split(':')[1]
 
-    user_languages[user_id] = new_lang
+    profile_cache.update(user_id, language_code=new_lang)
+    await state_backend.set_language(user_id, new_lang)
+    current_user_language.set((user_id, new_lang))
 
-    async with httpx.AsyncClient() as client:
-        response = await client.patch(f"{API_URL}/users/{user_id}/language", json={"language_code": new_lang})
-        response.raise_for_status()
+    await api.set_language(user_id, new_lang)
 
     confirm_message_text = get_translated_text("language_set", new_lang, lang=new_lang.upper())
 
@@ -193,110 +281,79 @@ async def set_language_callback(callback_query: types.CallbackQuery):
     )
     await callback_query.answer()
 
-@dp.message(lambda message: is_button_text_for_key(message.text, "btn_user"))
+@dp.message(ButtonText("btn_user"))
 async def handle_user_button(message: types.Message, state: FSMContext):
     await delete_old_messages(message.from_user.id) 
     await state.clear()
     user_id = message.from_user.id
-    current_lang = user_languages.get(user_id, 'en') 
+    current_lang = get_user_language(user_id, 'en') 
 
-    async with httpx.AsyncClient() as client:
-        all_user_info_response = await client.get(f"{API_URL}/users/{user_id}")
-        all_user_info_response.raise_for_status()
-        user_data = all_user_info_response.json()
+    user_data = await profile_cache.get(user_id) or {}
 
-        username = user_data.get("username")
-        first_name = user_data.get("first_name")
-        last_name = user_data.get("last_name")
-        language_code_db = user_data.get("language_code")
-    
-        user_text = (
-            f"{get_translated_text('user_info_title', current_lang)}\n\n"
-            f"{get_translated_text('username', current_lang)}: {username if username else 'none'}\n"
-            f"{get_translated_text('first_name', current_lang)}: {first_name if first_name else 'none'}\n"
-            f"{get_translated_text('last_name', current_lang)}: {last_name if last_name else 'none'}\n"
-            f"{get_translated_text('language', current_lang)}: {language_code_db if language_code_db else 'none'}\n"
-        )
+    username = user_data.get("username")
+    first_name = user_data.get("first_name")
+    last_name = user_data.get("last_name")
+    language_code_db = user_data.get("language_code")
 
-        await message.answer(user_text)
+    user_text = (
+        f"{get_translated_text('user_info_title', current_lang)}\n\n"
+        f"{get_translated_text('username', current_lang)}: {username if username else 'none'}\n"
+        f"{get_translated_text('first_name', current_lang)}: {first_name if first_name else 'none'}\n"
+        f"{get_translated_text('last_name', current_lang)}: {last_name if last_name else 'none'}\n"
+        f"{get_translated_text('language', current_lang)}: {language_code_db if language_code_db else 'none'}\n"
+    )
+
+    await message.answer(user_text)
 
-@dp.message(lambda message: is_button_text_for_key(message.text, "btn_settings"))
+@dp.message(ButtonText("btn_settings"))
 async def settings_button(message: types.Message, state: FSMContext):
     await delete_old_messages(message.from_user.id) 
     await state.clear()
     user_id = message.from_user.id
-    current_lang = user_languages.get(user_id, 'en') 
+    current_lang = get_user_language(user_id, 'en') 
 
     settings_message = get_translated_text("button_settings", current_lang)
     
-    button_en = InlineKeyboardButton(text="English", callback_data="set_lang:en") 
-    button_ru = InlineKeyboardButton(text="Русский", callback_data="set_lang:ru")
-    button_hy = InlineKeyboardButton(text="Հայերեն", callback_data="set_lang:hy")
-    
-    choose_language_markup = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                button_en,
-                button_ru,
-                button_hy
-            ]
-        ]
-    )
+    choose_language_markup = translations.current.language_markup
     msg = await message.answer(settings_message, reply_markup=choose_language_markup) 
     await add_message_to_delete(user_id, msg.message_id) 
 
     
-@dp.message(lambda message: is_button_text_for_key(message.text, "btn_create_lesson"))
+@dp.message(ButtonText("btn_create_lesson"))
 async def start_create_lesson(message:types.Message, state: FSMContext):
     await delete_old_messages(message.from_user.id) 
     user_id = message.from_user.id
-    current_lang = user_languages.get(user_id, "en") 
+    current_lang = get_user_language(user_id, "en") 
     
     await state.clear()
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{API_URL}/users/{user_id}")
-            response.raise_for_status()
-            user_data = response.json()
-            last_request = user_data.get("last_request")
-            
-            if last_request and last_request.get("topic") and last_request.get("current_level") and last_request.get("target_level"):
-                await state.update_data(
-                    lesson_topic = last_request["topic"],
-                    lesson_current_level = last_request["current_level"],
-                    lesson_target_level = last_request["target_level"]
-                )
+    try:
+        user_data = await profile_cache.get(user_id) or {}
+        last_request = user_data.get("last_request")
+        
+        if last_request and last_request.get("topic") and last_request.get("current_level") and last_request.get("target_level"):
+            await state.update_data(
+                lesson_topic = last_request["topic"],
+                lesson_current_level = last_request["current_level"],
+                lesson_target_level = last_request["target_level"]
+            )
 
-                confirmation_message_text = (
-                        f"{get_translated_text('ask_study_topic', current_lang)}: {last_request['topic']}\n"
-                        f"{get_translated_text('ask_current_level', current_lang)}: {last_request['current_level']}\n"
-                        f"{get_translated_text('ask_target_level', current_lang)}: {last_request['target_level']}\n\n"
-                        f"{get_translated_text('confirm_lesson', current_lang)}"
-                    )
-                
-                confirm_button = InlineKeyboardButton(text = get_translated_text("btn_confirm", current_lang), callback_data="confirm_button")
-                edit_button = InlineKeyboardButton(text = get_translated_text("btn_edit", current_lang), callback_data="edit_lesson")
-                cancel_button = InlineKeyboardButton(text=get_translated_text("btn_cancel", current_lang), callback_data="cancel_lesson")
-            
-                confirmation_markup = InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [confirm_button, edit_button, cancel_button]
-                    ]
+            confirmation_message_text = (
+                    f"{get_translated_text('ask_study_topic', current_lang)}: {last_request['topic']}\n"
+                    f"{get_translated_text('ask_current_level', current_lang)}: {last_request['current_level']}\n"
+                    f"{get_translated_text('ask_target_level', current_lang)}: {last_request['target_level']}\n\n"
+                    f"{get_translated_text('confirm_lesson', current_lang)}"
                 )
-                msg = await message.answer(confirmation_message_text, reply_markup=confirmation_markup) 
-                await add_message_to_delete(user_id, msg.message_id) 
-                await state.set_state(CreateLessonStates.waiting_for_confirmation)
-                return
-
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                pass 
-            else:
-                raise
-        except Exception as e:
-            print(f"Error checking last_request: {e}")
-            pass 
+            
+            confirmation_markup = translations.current.confirmation_markup(current_lang)
+            msg = await message.answer(confirmation_message_text, reply_markup=confirmation_markup) 
+            await add_message_to_delete(user_id, msg.message_id) 
+            await state.set_state(CreateLessonStates.waiting_for_confirmation)
+            return
+
+    except Exception as e:
+        log(f"Error checking last_request: {e}")
+        pass 
 
     full_prompt = (
         f"{get_translated_text('ask_study_topic', current_lang)}\n"
@@ -314,7 +371,7 @@ async def start_create_lesson(message:types.Message, state: FSMContext):
 @dp.message(CreateLessonStates.waiting_for_lesson_details)
 async def proces_lesson_details(message:types.Message, state:FSMContext):
     user_id = message.from_user.id
-    current_lang = user_languages.get(user_id, 'en') 
+    current_lang = get_user_language(user_id, 'en') 
     
     user_input = message.text.strip()
     parts = [p.strip() for p in user_input.replace("\n",",").split(",") if p.strip()]
@@ -344,21 +401,14 @@ async def proces_lesson_details(message:types.Message, state:FSMContext):
             "target_level": user_data.get("lesson_target_level")
         }
 
-        async with httpx.AsyncClient() as client:
-            response_post = await client.post(f"{API_URL}/users/{user_id}/last_request", json=lesson_details_for_api)
-            response_post.raise_for_status()
-
-        await asyncio.sleep(0.5)
+        saved_request = await api.save_last_request(user_id, lesson_details_for_api)
+        if saved_request != lesson_details_for_api:
+            log(f"API acknowledged a different last_request for {user_id}: {saved_request}")
+            profile_cache.invalidate(user_id)
+        else:
+            profile_cache.update(user_id, last_request=saved_request)
 
-        confirm_button = InlineKeyboardButton(text = get_translated_text("btn_confirm", current_lang), callback_data="confirm_button")
-        edit_button = InlineKeyboardButton(text = get_translated_text("btn_edit", current_lang), callback_data="edit_lesson")
-        cancel_button = InlineKeyboardButton(text=get_translated_text("btn_cancel", current_lang), callback_data="cancel_lesson")
-    
-        confirmation_markup = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [confirm_button, edit_button, cancel_button]
-            ]
-        )
+        confirmation_markup = translations.current.confirmation_markup(current_lang)
         await delete_old_messages(user_id) 
         msg = await message.answer(confirmation_message_text, reply_markup=confirmation_markup) 
         await add_message_to_delete(user_id, msg.message_id) 
@@ -371,15 +421,14 @@ async def proces_lesson_details(message:types.Message, state:FSMContext):
 @dp.callback_query(F.data == "cancel_lesson", CreateLessonStates.waiting_for_confirmation)
 async def delete_lesson(callback_query:types.CallbackQuery, state: FSMContext):
         await delete_old_messages(callback_query.from_user.id) 
-        current_lang = user_languages.get(callback_query.from_user.id, "en")
+        current_lang = get_user_language(callback_query.from_user.id, "en")
         
         user_id = callback_query.from_user.id
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(f"{API_URL}/users/{user_id}/last_request", json={})
-                response.raise_for_status()
-            except Exception as e:
-                print(f"Error clearing last_request on cancel: {e}")
+        try:
+            await api.clear_last_request(user_id)
+            profile_cache.update(user_id, last_request=None)
+        except Exception as e:
+            log(f"Error clearing last_request on cancel: {e}")
 
         await callback_query.message.answer(get_translated_text("lesson_cancelled", current_lang))
         
@@ -389,17 +438,16 @@ async def delete_lesson(callback_query:types.CallbackQuery, state: FSMContext):
 @dp.callback_query(F.data == "edit_lesson", CreateLessonStates.waiting_for_confirmation)
 async def edit_lesson(callback_query:types.CallbackQuery, state: FSMContext):
         await delete_old_messages(callback_query.from_user.id) 
-        current_lang = user_languages.get(callback_query.from_user.id, "en")
+        current_lang = get_user_language(callback_query.from_user.id, "en")
         
         await state.clear()
         
         user_id = callback_query.from_user.id
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(f"{API_URL}/users/{user_id}/last_request", json={})
-                response.raise_for_status()
-            except Exception as e:
-                print(f"Error clearing last_request on edit: {e}")
+        try:
+            await api.clear_last_request(user_id)
+            profile_cache.update(user_id, last_request=None)
+        except Exception as e:
+            log(f"Error clearing last_request on edit: {e}")
 
         full_prompt = (
             f"{get_translated_text('ask_study_topic', current_lang)}\n"
@@ -418,93 +466,283 @@ async def edit_lesson(callback_query:types.CallbackQuery, state: FSMContext):
 async def send_lesson_details(callback_query:types.CallbackQuery, state: FSMContext):
         await delete_old_messages(callback_query.from_user.id) 
         user_id = callback_query.from_user.id
-        current_lang = user_languages.get(user_id, "en")
+        current_lang = get_user_language(user_id, "en")
         
-        user_data = await state.get_data()
-
-        await callback_query.message.answer(get_translated_text("generating_lesson_pdf", current_lang))
+        status_msg = await callback_query.message.answer(get_translated_text("generating_lesson_pdf", current_lang))
         await callback_query.answer()
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response_get_pdf = await client.get(f"{API_URL}/users/{user_id}/lesson_details")
-            response_get_pdf.raise_for_status()
-
-            pdf_data = BytesIO(response_get_pdf.content)
-            pdf_data.name = f"{user_data.get('lesson_topic')}_lesson.pdf"
+        async def show_progress(progress: dict):
+            try:
+                await status_msg.edit_text(format_lesson_progress(progress, current_lang))
+            except TelegramBadRequest:
+                pass
 
-            await bot.send_document(chat_id=user_id, document=types.BufferedInputFile(pdf_data.getvalue(), filename=f"{user_data.get("lesson_topic")}_lesson.pdf"))
-            await callback_query.message.answer(get_translated_text("lesson_sent_successfully", current_lang))
+        job = await api.create_lesson_job(user_id)
 
         await state.clear()
+        profile_cache.update(user_id, last_request=None)
+
+        run_in_background(follow_lesson_job(job["job_id"], callback_query.message, current_lang, show_progress))
+
+async def follow_lesson_job(job_id: str, message: types.Message, lang_code: str, on_progress=None):
+    try:
+        job = await wait_for_lesson_job(job_id, LESSON_JOB_TIMEOUT, on_progress)
+    except TimeoutError:
+        await message.answer(get_translated_text("lesson_still_generating", lang_code))
+        await deliver_lesson_job_when_finished(job_id)
+        return
+    except Exception as e:
+        log(f"Error waiting for lesson job {job_id}: {e}")
+        return
+
+    await deliver_lesson_job(job["job_id"])
+
+async def wait_for_lesson_job(job_id: str, timeout: float, on_progress=None) -> dict:
+    return await lesson_job_waiter.wait(job_id, api.get_lesson_job, timeout=timeout, on_progress=on_progress)
+
+def format_lesson_progress(progress: dict, lang_code: str) -> str:
+    if progress.get("stage") == "rendering":
+        return get_translated_text("lesson_rendering_pdf", lang_code)
+    return (
+        f"{get_translated_text('generating_lesson_pdf', lang_code)}\n\n"
+        f"{get_translated_text('lesson_progress', lang_code, done=progress.get('sections_done', 0), total=progress.get('sections_total', 0))}"
+    )
+
+async def deliver_lesson_job_when_finished(job_id: str):
+    try:
+        job = await wait_for_lesson_job(job_id, LESSON_JOB_LATE_TIMEOUT)
+    except Exception as e:
+        log(f"Error waiting for lesson job {job_id}: {e}")
+        return
+    await deliver_lesson_job(job["job_id"])
+
+async def deliver_lesson_job(job_id: str):
+    job = await api.claim_lesson_delivery(job_id)
+    if job is None:
+        return
+
+    user_id = job["telegram_id"]
+    current_lang = await resolve_user_language(user_id)
+
+    if job.get("status") != "done":
+        await bot.send_message(user_id, get_translated_text("lesson_generation_failed", current_lang))
+        return
+
+    topic = job["params"]["topic"]
+    await send_cached_document(user_id, job["result"]["filename"], f"{topic}_lesson.pdf", api.url(f"/lessons/jobs/{job['job_id']}/pdf"))
+    await bot.send_message(user_id, get_translated_text("lesson_sent_successfully", current_lang))
+
+def callback_authorized(request: web.Request) -> bool:
+    return hmac.compare_digest(request.headers.get("X-Studiora-Secret", ""), BOT_CALLBACK_SECRET)
+
+async def handle_lesson_job_callback(request: web.Request) -> web.Response:
+    if not callback_authorized(request):
+        return web.Response(status=403)
+
+    current_request_id.set(request.headers.get("X-Request-ID") or new_request_id())
+    job = await request.json()
+    if job.get("event") == "progress":
+        run_in_background(lesson_job_waiter.progress(job))
+    elif not lesson_job_waiter.resolve(job):
+        run_in_background(deliver_lesson_job(job["job_id"]))
+    return web.json_response({"ok": True})
     
 
-@dp.message(lambda message: is_button_text_for_key(message.text, "btn_history"))
+@dp.message(ButtonText("btn_history"))
 async def handle_history_button(message: types.Message, state: FSMContext):
-    await delete_old_messages(message.from_user.id) 
+    old_messages = await state_backend.pop_messages_to_delete(message.from_user.id)
     await state.clear()
-    await send_history_with_pagination(message.chat.id, skip=0)
+    await asyncio.gather(
+        telegram_io.delete_messages(message.from_user.id, old_messages),
+        send_history_with_pagination(message.chat.id),
+    )
 
 @dp.callback_query(F.data.startswith("history_page:"))
 async def handle_history_pagination(callback_query: types.CallbackQuery):
-    await delete_old_messages(callback_query.from_user.id) 
-    skip = int(callback_query.data.split(":")[1])
+    page = int(callback_query.data.split(":")[1])
     user_id = callback_query.from_user.id
+    old_messages = await state_backend.pop_messages_to_delete(user_id)
+
+    # Cursors don't fit in Telegram's 64-byte callback data, so buttons carry the page number
+    # and the cursor handed out for that page is kept in the state backend.
+    cursor = await state_backend.get_history_cursor(user_id, page) if page > 0 else None
+    if cursor is None:
+        page = 0
+
+    await asyncio.gather(
+        telegram_io.delete_messages(user_id, old_messages),
+        send_history_with_pagination(user_id=user_id, page=page, cursor=cursor),
+        callback_query.answer(),
+    )
 
-    await send_history_with_pagination(user_id=user_id, skip=skip)
-    await callback_query.answer()
-
-async def send_history_with_pagination(user_id: int, skip: int = 0):
-    current_lang = user_languages.get(user_id, 'ru')
+async def send_history_with_pagination(user_id: int, page: int = 0, cursor: str | None = None):
+    current_lang = get_user_language(user_id, 'ru')
     limit = 5
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{API_URL}/users/{user_id}/history?skip={skip}&limit={limit}")
-        resp.raise_for_status()
-        data = resp.json()
-
-        pdf_files = data.get("pdf_files", [])
-        total = data.get("total_count", 0)
-
-        if not pdf_files:
-            text = get_translated_text("no_pdfs_found", current_lang)
-            msg = await bot.send_message(user_id, text)
-            await add_message_to_delete(user_id, msg.message_id) 
-            return
+    data = await api.get_history(user_id, limit, cursor)
 
-        API_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "api"))
-        DB_DIR = os.path.join(API_DIR, "db")
+    lessons = data.get("lessons", [])
+    total = data.get("total_count", 0)
 
-        for filename in pdf_files:
-            file_path = os.path.join(DB_DIR, str(user_id), filename)
-            if not os.path.exists(file_path):
-                continue
-            with open(file_path, "rb") as f:
-                msg = await bot.send_document(chat_id=user_id, document=types.BufferedInputFile(f.read(), filename=filename), caption=f"📄 {filename}")
-                await add_message_to_delete(user_id, msg.message_id) 
-        
-        buttons = []
-        if skip > 0:
-            buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"history_page:{skip - limit}"))
-        if skip + limit < total:
-            buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"history_page:{skip + limit}"))
-        
-        current_page = (skip // limit) + 1
-        total_pages = (total + limit - 1) // limit
-        page_info_text = get_translated_text("page_info", current_lang, current_page=current_page, total_pages=total_pages)
-        
-        markup = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    if not lessons:
+        text = get_translated_text("no_pdfs_found", current_lang)
+        msg = await telegram_io.send_message(user_id, text)
+        await add_message_to_delete(user_id, msg.message_id) 
+        return
 
-        nav_msg = await bot.send_message(
-            chat_id=user_id,
-            text=page_info_text,
-            reply_markup=markup
-        )
-        await add_message_to_delete(user_id, nav_msg.message_id) 
+    documents = [
+        (lesson["filename"], lesson["filename"], api.url(f"/users/{user_id}/lessons/{lesson['lesson_id']}/pdf"), f"📄 {lesson['filename']}")
+        for lesson in lessons
+    ]
+    for msg in await send_cached_documents(user_id, documents):
+        await add_message_to_delete(user_id, msg.message_id) 
+    
+    next_cursor = data.get("next_cursor")
+    if next_cursor:
+        await state_backend.set_history_cursor(user_id, page + 1, next_cursor)
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"history_page:{page - 1}"))
+    if next_cursor:
+        buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"history_page:{page + 1}"))
+    
+    current_page = page + 1
+    total_pages = (total + limit - 1) // limit
+    page_info_text = get_translated_text("page_info", current_lang, current_page=current_page, total_pages=total_pages)
+    
+    markup = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
 
+    nav_msg = await telegram_io.send_message(
+        user_id,
+        page_info_text,
+        reply_markup=markup
+    )
+    await add_message_to_delete(user_id, nav_msg.message_id) 
+
+
+async def handle_profile_invalidation(request: web.Request) -> web.Response:
+    if not callback_authorized(request):
+        return web.Response(status=403)
+
+    user_id = int(request.match_info["user_id"])
+    profile_cache.invalidate(user_id)
+    await state_backend.clear_language(user_id)
+    return web.json_response({"ok": True})
+
+async def feed_update(update: Update):
+    await dp.feed_update(bot, update)
+
+update_pipeline = UpdatePipeline(feed_update, BOT_WEBHOOK_WORKERS, BOT_WEBHOOK_QUEUE_SIZE)
+
+async def handle_webhook(request: web.Request) -> web.Response:
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret, BOT_WEBHOOK_SECRET):
+        return web.Response(status=403)
+
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+
+    if BOT_ROLE == "ingest":
+        await state_backend.publish_update(partition_for(update, BOT_PARTITIONS), update.model_dump_json(exclude_unset=True))
+        return web.Response()
+
+    user_id = update_user_id(update)
+    if not update_pipeline.submit(user_id if user_id is not None else update.update_id, update):
+        return web.Response(status=503, headers={"Retry-After": "1"})
+    return web.Response()
+
+async def handle_bot_metrics(request: web.Request) -> web.Response:
+    return web.json_response({
+        "update_pipeline": update_pipeline.snapshot(),
+        "profile_cache": profile_cache.snapshot(),
+        "telegram_io": telegram_io.snapshot(),
+    })
+
+async def start_callback_server() -> web.AppRunner | None:
+    if not BOT_CALLBACK_PORT:
+        return None
+    if not BOT_CALLBACK_SECRET:
+        raise RuntimeError("BOT_CALLBACK_PORT needs BOT_CALLBACK_SECRET")
+
+    app = web.Application()
+    app.router.add_post("/internal/lesson_jobs", handle_lesson_job_callback)
+    app.router.add_post("/internal/profiles/{user_id}/invalidate", handle_profile_invalidation)
+    app.router.add_get("/internal/metrics", handle_bot_metrics)
+    if BOT_MODE == "webhook":
+        app.router.add_post(BOT_WEBHOOK_PATH, handle_webhook)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, BOT_CALLBACK_HOST, int(BOT_CALLBACK_PORT)).start()
+    return runner
+
+async def wait_for_stop_signal():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+async def run_webhook():
+    if not BOT_CALLBACK_PORT or not BOT_WEBHOOK_URL or not BOT_WEBHOOK_SECRET:
+        raise RuntimeError("BOT_MODE=webhook needs BOT_CALLBACK_PORT, BOT_WEBHOOK_URL and BOT_WEBHOOK_SECRET")
+
+    await update_pipeline.start()
+    await dp.emit_startup(bot=bot)
+    await bot.set_webhook(
+        BOT_WEBHOOK_URL,
+        secret_token=BOT_WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    try:
+        await wait_for_stop_signal()
+    finally:
+        await update_pipeline.drain(BOT_WEBHOOK_DRAIN_TIMEOUT)
+        await dp.emit_shutdown(bot=bot)
+
+async def run_updates():
+    if BOT_MODE == "webhook":
+        await run_webhook()
+        return
+
+    if BOT_ROLE == "standalone":
+        await dp.start_polling(bot)
+        return
+
+    if not state_backend.supports_partitions:
+        raise RuntimeError(f"BOT_ROLE={BOT_ROLE} needs a shared STATE_BACKEND_URL")
+
+    if BOT_ROLE == "ingest":
+        await run_ingest(bot, dp, state_backend, BOT_PARTITIONS)
+    elif BOT_ROLE == "worker":
+        partitions = [int(p) for p in BOT_WORKER_PARTITIONS.split(",") if p.strip()]
+        if not partitions:
+            raise RuntimeError("BOT_ROLE=worker needs BOT_WORKER_PARTITIONS, e.g. 0,1")
+        if len(set(partitions)) != len(partitions) or not all(0 <= p < BOT_PARTITIONS for p in partitions):
+            raise RuntimeError(f"BOT_WORKER_PARTITIONS must list distinct partitions between 0 and {BOT_PARTITIONS - 1}")
+        await dp.emit_startup(bot=bot)
+        try:
+            await run_partition_workers(bot, dp, state_backend, partitions)
+        finally:
+            await dp.emit_shutdown(bot=bot)
+    else:
+        raise RuntimeError(f"Unknown BOT_ROLE: {BOT_ROLE!r}")
 
 async def main():
     dp.update.outer_middleware.register(set_user_language_middleware)
-    await dp.start_polling(bot)
+    if TRANSLATIONS_RELOAD_INTERVAL > 0:
+        run_in_background(translations.watch(TRANSLATIONS_RELOAD_INTERVAL))
+    asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, translations.reload_if_changed)
+    callback_runner = await start_callback_server()
+    try:
+        await run_updates()
+    finally:
+        if callback_runner is not None:
+            await callback_runner.cleanup()
+        if file_id_store is not None:
+            file_id_store.close()
+        await state_backend.close()
+        await bot.session.close()
 
 if __name__ == '__main__': 
     asyncio.run(main())
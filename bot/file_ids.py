@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+import threading
+
+from collections import OrderedDict
+
+
+class SqliteFileIds:
+    # Per-host store: bots running on several hosts share file ids through the Redis state backend instead.
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids ("
+                "user_id INTEGER NOT NULL, "
+                "file_key TEXT NOT NULL, "
+                "file_id TEXT NOT NULL, "
+                "PRIMARY KEY (user_id, file_key))"
+            )
+            self.conn.commit()
+
+    def _fetch(self, user_id, file_key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT file_id FROM file_ids WHERE user_id = ? AND file_key = ?",
+                (user_id, file_key),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def _write(self, sql, params):
+        with self.lock:
+            self.conn.execute(sql, params)
+            self.conn.commit()
+
+    async def get_file_id(self, user_id, file_key):
+        return await asyncio.to_thread(self._fetch, user_id, file_key)
+
+    async def set_file_id(self, user_id, file_key, file_id):
+        await asyncio.to_thread(
+            self._write,
+            "INSERT OR REPLACE INTO file_ids (user_id, file_key, file_id) VALUES (?, ?, ?)",
+            (user_id, file_key, file_id),
+        )
+
+    async def discard_file_id(self, user_id, file_key):
+        await asyncio.to_thread(
+            self._write,
+            "DELETE FROM file_ids WHERE user_id = ? AND file_key = ?",
+            (user_id, file_key),
+        )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class FileIdCache:
+    def __init__(self, store, max_entries=10000):
+        self.store = store
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+
+    def _remember(self, key, file_id):
+        self.memory[key] = file_id
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    async def get(self, user_id, file_key):
+        key = (user_id, file_key)
+        file_id = self.memory.get(key)
+        if file_id is not None:
+            self.memory.move_to_end(key)
+            return file_id
+
+        file_id = await self.store.get_file_id(user_id, file_key)
+        if file_id is not None:
+            self._remember(key, file_id)
+        return file_id
+
+    async def set(self, user_id, file_key, file_id):
+        self._remember((user_id, file_key), file_id)
+        await self.store.set_file_id(user_id, file_key, file_id)
+
+    async def discard(self, user_id, file_key):
+        self.memory.pop((user_id, file_key), None)
+        await self.store.discard_file_id(user_id, file_key)
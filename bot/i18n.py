@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+
+from types import MappingProxyType
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+
+
+DEFAULT_LANGUAGE = "en"
+BUTTON_KEY_PREFIX = "btn_"
+EMPTY_ENTRY = ("", False)
+
+
+class Catalog:
+    def __init__(self, data):
+        languages = []
+        strings = {}
+        reverse = {}
+
+        for key, translations in data.items():
+            for lang_code, text in translations.items():
+                if lang_code not in languages:
+                    languages.append(lang_code)
+                strings[(key, lang_code)] = (text, "{" in text or "}" in text)
+                if key.startswith(BUTTON_KEY_PREFIX):
+                    reverse.setdefault(text, key)
+
+        self.languages = tuple(languages)
+        self.strings = MappingProxyType(strings)
+        self.reverse = MappingProxyType(reverse)
+
+        self.language_markup = self._build_language_markup(data.get("language_name", {}))
+        self.main_keyboards = MappingProxyType({lang: self._build_main_keyboard(lang) for lang in self.languages})
+        self.confirmation_markups = MappingProxyType({lang: self._build_confirmation_markup(lang) for lang in self.languages})
+
+    def text(self, key, lang_code=DEFAULT_LANGUAGE, **kwargs):
+        entry = self.strings.get((key, lang_code))
+        if entry is None:
+            entry = self.strings.get((key, DEFAULT_LANGUAGE), EMPTY_ENTRY)
+        text, templated = entry
+        return text.format_map(kwargs) if templated else text
+
+    def key_for(self, text):
+        return self.reverse.get(text)
+
+    def main_keyboard(self, lang_code):
+        return self.main_keyboards.get(lang_code) or self.main_keyboards[DEFAULT_LANGUAGE]
+
+    def confirmation_markup(self, lang_code):
+        return self.confirmation_markups.get(lang_code) or self.confirmation_markups[DEFAULT_LANGUAGE]
+
+    def _build_main_keyboard(self, lang_code):
+        return ReplyKeyboardMarkup(
+            keyboard=[
+                [KeyboardButton(text=self.text("btn_user", lang_code)), KeyboardButton(text=self.text("btn_history", lang_code))],
+                [KeyboardButton(text=self.text("btn_settings", lang_code)), KeyboardButton(text=self.text("btn_create_lesson", lang_code))],
+                [KeyboardButton(text="/help")]
+            ],
+            resize_keyboard=True,
+            one_time_keyboard=False,
+            is_persistent=False
+        )
+
+    def _build_confirmation_markup(self, lang_code):
+        return InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(text=self.text("btn_confirm", lang_code), callback_data="confirm_button"),
+                    InlineKeyboardButton(text=self.text("btn_edit", lang_code), callback_data="edit_lesson"),
+                    InlineKeyboardButton(text=self.text("btn_cancel", lang_code), callback_data="cancel_lesson"),
+                ]
+            ]
+        )
+
+    def _build_language_markup(self, language_names):
+        return InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(text=name, callback_data=f"set_lang:{lang_code}")
+                    for lang_code, name in language_names.items()
+                ]
+            ]
+        )
+
+
+class CatalogStore:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.mtime = None
+        self.current = None
+        self.reload()
+
+    def reload(self):
+        mtime = os.path.getmtime(self.filepath)
+        with open(self.filepath, 'r', encoding='utf-8') as f:
+            catalog = Catalog(json.load(f))
+        self.current = catalog
+        self.mtime = mtime
+        return catalog
+
+    def reload_if_changed(self):
+        try:
+            if os.path.getmtime(self.filepath) == self.mtime:
+                return False
+            self.reload()
+        except (OSError, ValueError) as e:
+            print(f"Translations reload failed, keeping the previous catalog: {e}")
+            return False
+        print(f"Translations reloaded from {self.filepath}")
+        return True
+
+    async def watch(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.reload_if_changed()
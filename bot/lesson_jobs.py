@@ -0,0 +1,53 @@
+import asyncio
+
+
+JOB_FINISHED_STATUSES = ("done", "failed")
+
+
+class PendingLessonJob:
+    def __init__(self, on_progress):
+        self.future = asyncio.get_running_loop().create_future()
+        self.on_progress = on_progress
+        self.last_progress = None
+
+    async def report(self, progress):
+        if self.on_progress is None or not progress or progress == self.last_progress:
+            return
+        self.last_progress = progress
+        await self.on_progress(progress)
+
+
+class LessonJobWaiter:
+    def __init__(self):
+        self.waiters = {}
+
+    def resolve(self, job):
+        pending = self.waiters.get(job.get("job_id"))
+        if pending is None or pending.future.done():
+            return False
+        pending.future.set_result(job)
+        return True
+
+    async def progress(self, job):
+        pending = self.waiters.get(job.get("job_id"))
+        if pending is None:
+            return False
+        await pending.report(job.get("progress"))
+        return True
+
+    async def wait(self, job_id, fetch_job, timeout, on_progress=None, poll_interval=2.0, max_poll_interval=10.0):
+        pending = PendingLessonJob(on_progress)
+        self.waiters[job_id] = pending
+        try:
+            async with asyncio.timeout(timeout):
+                while True:
+                    job = await fetch_job(job_id)
+                    if job.get("status") in JOB_FINISHED_STATUSES:
+                        return job
+                    await pending.report(job.get("progress"))
+                    try:
+                        return await asyncio.wait_for(asyncio.shield(pending.future), timeout=poll_interval)
+                    except asyncio.TimeoutError:
+                        poll_interval = min(poll_interval * 1.5, max_poll_interval)
+        finally:
+            self.waiters.pop(job_id, None)
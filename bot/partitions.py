@@ -0,0 +1,98 @@
+import asyncio
+import os
+import socket
+import time
+
+from aiogram.types import Update
+
+from state_backend import PARTITION_LEASE_SECONDS
+
+
+def update_user_id(update: Update) -> int | None:
+    try:
+        event = update.event
+    except Exception:
+        return None
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    return chat.id if chat is not None else None
+
+
+def partition_for(update: Update, partitions: int) -> int:
+    user_id = update_user_id(update)
+    return user_id % partitions if user_id is not None else 0
+
+
+async def run_ingest(bot, dp, backend, partitions, poll_timeout=30):
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=poll_timeout, allowed_updates=allowed_updates)
+        except Exception as e:
+            print(f"Polling error: {e}")
+            await asyncio.sleep(1)
+            continue
+
+        for update in updates:
+            await backend.publish_update(
+                partition_for(update, partitions),
+                update.model_dump_json(exclude_unset=True),
+            )
+            offset = update.update_id + 1
+
+
+async def claim_partitions(backend, partitions, owner, wait=PARTITION_LEASE_SECONDS):
+    deadline = time.monotonic() + wait
+    claimed = []
+    for partition in partitions:
+        while True:
+            current = await backend.claim_partition(partition, owner)
+            if current is None:
+                claimed.append(partition)
+                break
+            if time.monotonic() >= deadline:
+                await release_partitions(backend, claimed, owner)
+                raise RuntimeError(f"Partition {partition} is already handled by {current}")
+            await asyncio.sleep(1)
+
+
+async def release_partitions(backend, partitions, owner):
+    for partition in partitions:
+        await backend.release_partition(partition, owner)
+
+
+async def hold_partitions(backend, partitions, owner):
+    while True:
+        await asyncio.sleep(PARTITION_LEASE_SECONDS / 3)
+        for partition in partitions:
+            if not await backend.renew_partition(partition, owner):
+                raise RuntimeError(f"Lost the lease on partition {partition}")
+
+
+async def run_partition_worker(bot, dp, backend, partition):
+    consumer = f"partition-{partition}"
+    async for entry_id, payload in backend.consume_updates(partition, consumer):
+        try:
+            update = Update.model_validate_json(payload, context={"bot": bot})
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            print(f"Error handling update from partition {partition}: {e}")
+        await backend.ack_update(partition, entry_id)
+
+
+async def run_partition_workers(bot, dp, backend, partitions):
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    await claim_partitions(backend, partitions, owner)
+    print(f"Handling partitions {', '.join(map(str, partitions))} as {owner}")
+    tasks = [asyncio.create_task(hold_partitions(backend, partitions, owner))]
+    tasks += [asyncio.create_task(run_partition_worker(bot, dp, backend, partition)) for partition in partitions]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await release_partitions(backend, partitions, owner)
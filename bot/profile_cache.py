@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from collections import OrderedDict
+
+
+class ProfileCache:
+    def __init__(self, fetch, max_entries, ttl_seconds):
+        self.fetch = fetch
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.stale_loads = set()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    def peek(self, user_id):
+        item = self.entries.get(user_id)
+        if item is None:
+            return None
+        expires_at, profile = item
+        if expires_at < time.monotonic():
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return profile
+
+    async def get(self, user_id):
+        profile = self.peek(user_id)
+        if profile is not None:
+            self.stats["hits"] += 1
+            return profile
+
+        task = self.inflight.get(user_id)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        self.stats["misses"] += 1
+        task = asyncio.create_task(self._load(user_id))
+        self.inflight[user_id] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, user_id):
+        task = asyncio.current_task()
+        try:
+            profile = await self.fetch(user_id)
+        finally:
+            if self.inflight.get(user_id) is task:
+                del self.inflight[user_id]
+            stale = task in self.stale_loads
+            self.stale_loads.discard(task)
+        if profile is not None and not stale:
+            self.put(user_id, profile)
+        return profile
+
+    def put(self, user_id, profile):
+        self.entries[user_id] = (time.monotonic() + self.ttl_seconds, profile)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def update(self, user_id, **fields):
+        profile = self.peek(user_id)
+        if profile is not None:
+            self.put(user_id, {**profile, **fields})
+
+    def invalidate(self, user_id):
+        self.stats["invalidations"] += 1
+        self.entries.pop(user_id, None)
+        task = self.inflight.pop(user_id, None)
+        if task is not None:
+            self.stale_loads.add(task)
+
+    def snapshot(self):
+        return {**self.stats, "entries": len(self.entries), "inflight": len(self.inflight)}
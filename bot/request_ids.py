@@ -0,0 +1,30 @@
+import uuid
+import httpx
+
+from contextvars import ContextVar
+
+
+current_request_id = ContextVar("current_request_id", default=None)
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+def request_headers():
+    request_id = current_request_id.get()
+    return {"X-Request-ID": request_id} if request_id else {}
+
+
+async def add_request_id_header(request: httpx.Request):
+    request_id = current_request_id.get()
+    if request_id and "X-Request-ID" not in request.headers:
+        request.headers["X-Request-ID"] = request_id
+
+
+API_EVENT_HOOKS = {"request": [add_request_id_header]}
+
+
+def log(message):
+    request_id = current_request_id.get()
+    print(f"[{request_id}] {message}" if request_id else message)
@@ -0,0 +1,221 @@
+from collections import OrderedDict
+
+from aiogram.fsm.storage.memory import MemoryStorage
+
+
+MESSAGES_TTL_SECONDS = 48 * 3600
+LANGUAGE_TTL_SECONDS = 30 * 24 * 3600
+FILE_ID_TTL_SECONDS = 30 * 24 * 3600
+PARTITION_LEASE_SECONDS = 30
+
+
+class MemoryStateBackend:
+    supports_partitions = False
+    shares_file_ids = False
+
+    def __init__(self, max_languages=10000):
+        self.storage = MemoryStorage()
+        self.messages = {}
+        self.history_cursors = {}
+        self.languages = OrderedDict()
+        self.max_languages = max_languages
+
+    def fsm_storage(self):
+        return self.storage
+
+    async def add_message_to_delete(self, user_id, message_id):
+        self.messages.setdefault(user_id, []).append(message_id)
+
+    async def pop_messages_to_delete(self, user_id):
+        return self.messages.pop(user_id, [])
+
+    async def get_history_cursor(self, user_id, page):
+        return self.history_cursors.get(user_id, {}).get(page)
+
+    async def set_history_cursor(self, user_id, page, cursor):
+        self.history_cursors.setdefault(user_id, {})[page] = cursor
+
+    async def get_language(self, user_id):
+        lang_code = self.languages.get(user_id)
+        if lang_code is not None:
+            self.languages.move_to_end(user_id)
+        return lang_code
+
+    async def set_language(self, user_id, lang_code):
+        self.languages[user_id] = lang_code
+        self.languages.move_to_end(user_id)
+        while len(self.languages) > self.max_languages:
+            self.languages.popitem(last=False)
+
+    async def clear_language(self, user_id):
+        self.languages.pop(user_id, None)
+
+    async def close(self):
+        await self.storage.close()
+
+
+class RedisStateBackend:
+    supports_partitions = True
+    shares_file_ids = True
+
+    def __init__(self, redis, prefix="studiora", stream_maxlen=100000):
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        self.redis = redis
+        self.prefix = prefix
+        self.stream_maxlen = stream_maxlen
+        self.storage = RedisStorage(redis=redis)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        from redis.asyncio import Redis
+
+        return cls(Redis.from_url(url), **kwargs)
+
+    def fsm_storage(self):
+        return self.storage
+
+    def _key(self, *parts):
+        return ":".join([self.prefix, *map(str, parts)])
+
+    async def add_message_to_delete(self, user_id, message_id):
+        key = self._key("messages", user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, message_id)
+            pipe.expire(key, MESSAGES_TTL_SECONDS)
+            await pipe.execute()
+
+    async def pop_messages_to_delete(self, user_id):
+        key = self._key("messages", user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.delete(key)
+            message_ids, _ = await pipe.execute()
+        return [int(message_id) for message_id in message_ids]
+
+    async def get_history_cursor(self, user_id, page):
+        return self._decoded(await self.redis.hget(self._key("history_cursors", user_id), page))
+
+    async def set_history_cursor(self, user_id, page, cursor):
+        key = self._key("history_cursors", user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, page, cursor)
+            pipe.expire(key, MESSAGES_TTL_SECONDS)
+            await pipe.execute()
+
+    async def get_language(self, user_id):
+        lang_code = await self.redis.get(self._key("lang", user_id))
+        return lang_code.decode() if isinstance(lang_code, bytes) else lang_code
+
+    async def set_language(self, user_id, lang_code):
+        await self.redis.set(self._key("lang", user_id), lang_code, ex=LANGUAGE_TTL_SECONDS)
+
+    async def clear_language(self, user_id):
+        await self.redis.delete(self._key("lang", user_id))
+
+    async def get_file_id(self, user_id, file_key):
+        return self._decoded(await self.redis.get(self._key("file_id", user_id, file_key)))
+
+    async def set_file_id(self, user_id, file_key, file_id):
+        await self.redis.set(self._key("file_id", user_id, file_key), file_id, ex=FILE_ID_TTL_SECONDS)
+
+    async def discard_file_id(self, user_id, file_key):
+        await self.redis.delete(self._key("file_id", user_id, file_key))
+
+    def _stream(self, partition):
+        return self._key("updates", partition)
+
+    async def publish_update(self, partition, payload):
+        await self.redis.xadd(
+            self._stream(partition),
+            {"update": payload},
+            maxlen=self.stream_maxlen,
+            approximate=True,
+        )
+
+    def _owner_key(self, partition):
+        return self._key("partition_owner", partition)
+
+    def _decoded(self, value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def claim_partition(self, partition, owner, ttl=PARTITION_LEASE_SECONDS):
+        key = self._owner_key(partition)
+        if await self.redis.set(key, owner, nx=True, ex=ttl):
+            return None
+        current = self._decoded(await self.redis.get(key))
+        return None if current == owner else current
+
+    async def renew_partition(self, partition, owner, ttl=PARTITION_LEASE_SECONDS):
+        from redis.exceptions import WatchError
+
+        key = self._owner_key(partition)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                if self._decoded(await pipe.get(key)) != owner:
+                    return False
+                pipe.multi()
+                pipe.expire(key, ttl)
+                await pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    async def release_partition(self, partition, owner):
+        from redis.exceptions import WatchError
+
+        key = self._owner_key(partition)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                if self._decoded(await pipe.get(key)) != owner:
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                await pipe.execute()
+            except WatchError:
+                pass
+
+    async def consume_updates(self, partition, consumer, group="workers", block_ms=5000, count=10):
+        from redis.exceptions import ResponseError
+
+        stream = self._stream(partition)
+        try:
+            await self.redis.xgroup_create(stream, group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+        start_id = "0-0"
+        while True:
+            start_id, claimed, *_ = await self.redis.xautoclaim(stream, group, consumer, min_idle_time=0, start_id=start_id, count=100)
+            if claimed:
+                print(f"Reclaimed {len(claimed)} pending updates in partition {partition}")
+            if start_id in (b"0-0", "0-0"):
+                break
+
+        last_id = "0"
+        while True:
+            response = await self.redis.xreadgroup(group, consumer, {stream: last_id}, count=count, block=block_ms)
+            entries = response[0][1] if response else []
+            if not entries and last_id == "0":
+                last_id = ">"
+                continue
+            for entry_id, fields in entries:
+                payload = fields.get(b"update", fields.get("update"))
+                yield entry_id, payload.decode() if isinstance(payload, bytes) else payload
+
+    async def ack_update(self, partition, entry_id, group="workers"):
+        await self.redis.xack(self._stream(partition), group, entry_id)
+
+    async def close(self):
+        await self.storage.close()
+
+
+def create_state_backend(url):
+    if not url:
+        return MemoryStateBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend.from_url(url)
+    raise ValueError(f"Unsupported STATE_BACKEND_URL: {url!r}")
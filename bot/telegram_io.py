@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+from collections import OrderedDict
+from aiogram.exceptions import TelegramRetryAfter
+
+from request_ids import log
+
+
+MEDIA_GROUP_MAX_ITEMS = 10
+DELETE_MESSAGES_MAX_IDS = 100
+
+
+class RateLimiter:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ChatSlot:
+    __slots__ = ("limiter", "blocked_until")
+
+    def __init__(self, rate, burst):
+        self.limiter = RateLimiter(rate, burst)
+        self.blocked_until = 0.0
+
+    async def wait_unblocked(self):
+        delay = self.blocked_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class TelegramIO:
+    def __init__(self, bot, global_rate=30, chat_rate=1, chat_burst=5, max_flood_wait=60, max_retries=3, max_chats=10000):
+        self.bot = bot
+        self.global_limiter = RateLimiter(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_flood_wait = max_flood_wait
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.chats = OrderedDict()
+        self.stats = {"calls": 0, "flood_waits": 0, "flood_wait_seconds": 0, "gave_up": 0, "media_groups": 0, "deleted": 0, "delete_errors": 0}
+
+    def _chat(self, chat_id):
+        slot = self.chats.get(chat_id)
+        if slot is None:
+            slot = self.chats[chat_id] = ChatSlot(self.chat_rate, self.chat_burst)
+            while len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+        else:
+            self.chats.move_to_end(chat_id)
+        return slot
+
+    async def run(self, chat_id, call, chat_limited=True):
+        slot = self._chat(chat_id)
+        for attempt in range(self.max_retries + 1):
+            await slot.wait_unblocked()
+            await self.global_limiter.acquire()
+            if chat_limited:
+                await slot.limiter.acquire()
+            self.stats["calls"] += 1
+            try:
+                return await call()
+            except TelegramRetryAfter as e:
+                self.stats["flood_waits"] += 1
+                if attempt == self.max_retries or e.retry_after > self.max_flood_wait:
+                    self.stats["gave_up"] += 1
+                    raise
+                self.stats["flood_wait_seconds"] += e.retry_after
+                slot.blocked_until = max(slot.blocked_until, time.monotonic() + e.retry_after)
+                log(f"Flood wait of {e.retry_after}s for chat {chat_id}")
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self.run(chat_id, lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs))
+
+    async def send_document(self, chat_id, document, caption=None):
+        return await self.run(chat_id, lambda: self.bot.send_document(chat_id=chat_id, document=document, caption=caption))
+
+    async def send_media_group(self, chat_id, media):
+        messages = []
+        for start in range(0, len(media), MEDIA_GROUP_MAX_ITEMS):
+            chunk = media[start:start + MEDIA_GROUP_MAX_ITEMS]
+            if len(chunk) == 1:
+                messages.append(await self.send_document(chat_id, chunk[0].media, chunk[0].caption))
+                continue
+            self.stats["media_groups"] += 1
+            messages.extend(await self.run(chat_id, lambda: self.bot.send_media_group(chat_id=chat_id, media=chunk)))
+        return messages
+
+    async def _delete_chunk(self, chat_id, message_ids):
+        try:
+            await self.run(chat_id, lambda: self.bot.delete_messages(chat_id=chat_id, message_ids=message_ids), chat_limited=False)
+        except Exception as e:
+            self.stats["delete_errors"] += 1
+            log(f"Could not delete {len(message_ids)} messages in chat {chat_id}: {e}")
+        else:
+            self.stats["deleted"] += len(message_ids)
+
+    async def delete_messages(self, chat_id, message_ids):
+        await asyncio.gather(*(
+            self._delete_chunk(chat_id, message_ids[start:start + DELETE_MESSAGES_MAX_IDS])
+            for start in range(0, len(message_ids), DELETE_MESSAGES_MAX_IDS)
+        ))
+
+    def snapshot(self):
+        return {**self.stats, "tracked_chats": len(self.chats)}
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from collections import deque
+
+
+class UpdatePipeline:
+    def __init__(self, handle, workers, queue_size):
+        self.handle = handle
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pending = {}
+        self.ready = asyncio.Queue()
+        self.queued_count = 0
+        self.tasks = []
+        self.accepting = False
+        self.in_flight = 0
+        self.stats = {"accepted": 0, "rejected": 0, "processed": 0, "errors": 0, "wait_seconds_total": 0.0, "handle_seconds_total": 0.0}
+
+    async def start(self):
+        self.accepting = True
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, key, update):
+        if not self.accepting or self.queued_count >= self.queue_size:
+            self.stats["rejected"] += 1
+            return False
+        updates = self.pending.get(key)
+        if updates is None:
+            updates = self.pending[key] = deque()
+            self.ready.put_nowait(key)
+        updates.append((time.monotonic(), update))
+        self.queued_count += 1
+        self.stats["accepted"] += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self.ready.get()
+            updates = self.pending[key]
+            enqueued_at, update = updates.popleft()
+            self.queued_count -= 1
+            started_at = time.monotonic()
+            self.stats["wait_seconds_total"] += started_at - enqueued_at
+            self.in_flight += 1
+            try:
+                await self.handle(update)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Error handling update: {e}")
+            finally:
+                self.in_flight -= 1
+                self.stats["processed"] += 1
+                self.stats["handle_seconds_total"] += time.monotonic() - started_at
+                if updates:
+                    self.ready.put_nowait(key)
+                else:
+                    del self.pending[key]
+                self.ready.task_done()
+
+    async def drain(self, timeout):
+        self.accepting = False
+        try:
+            await asyncio.wait_for(self.ready.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"Update pipeline drain timed out with {self.queued_count} updates queued")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def snapshot(self):
+        return {
+            **self.stats,
+            "accepting": self.accepting,
+            "in_flight": self.in_flight,
+            "queued": self.queued_count,
+            "queued_keys": len(self.pending),
+            "queue_capacity": self.queue_size,
+        }